@@ -0,0 +1,227 @@
+import csv
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import numpy as np
+from coordinate_conv import dms2degrees, geod2cart, cart2geod
+from datum_conv import conv_geod_datum
+
+
+def _float(chunk, name):
+    if name not in chunk:
+        raise KeyError("column '{}' not found in the input".format(name))
+    return np.asarray(chunk[name], dtype=float)
+
+
+def _op_dms2degrees(chunk, ctx):
+    for col in (ctx['lat'], ctx['lon']):
+        chunk[col] = dms2degrees([_float(chunk, col + '_d'), _float(chunk, col + '_m'), _float(chunk, col + '_s')])
+
+
+def _op_geod2cart(chunk, ctx):
+    chunk['X'], chunk['Y'], chunk['Z'] = geod2cart(_float(chunk, ctx['lon']), _float(chunk, ctx['lat']),
+                                                   _float(chunk, ctx['h']), ctx['elip'])
+
+
+def _op_cart2geod(chunk, ctx):
+    chunk[ctx['lon']], chunk[ctx['lat']], chunk[ctx['h']] = cart2geod(_float(chunk, 'X'), _float(chunk, 'Y'),
+                                                                      _float(chunk, 'Z'), ctx['elip'])
+
+
+def _op_conv_geod_datum(chunk, ctx):
+    if ctx.get('target') is None:
+        raise ValueError("conv_geod_datum requires a target datum")
+    chunk[ctx['lon']], chunk[ctx['lat']], chunk[ctx['h']] = conv_geod_datum(
+        _float(chunk, ctx['lon']), _float(chunk, ctx['lat']), _float(chunk, ctx['h']), ctx['elip'], ctx['target'])
+    # The following operations work on the target datum
+    ctx['elip'] = ctx['target']
+
+
+def _op_normal_gravity(chunk, ctx):
+    from gravity import normal_gravity
+    chunk['normal_gravity'] = normal_gravity(_float(chunk, ctx['lat']), ctx['elip'])
+
+
+OPERATIONS = {
+    'dms2degrees': _op_dms2degrees,
+    'geod2cart': _op_geod2cart,
+    'cart2geod': _op_cart2geod,
+    'conv_geod_datum': _op_conv_geod_datum,
+    'normal_gravity': _op_normal_gravity,
+}
+
+
+def process_chunk(chunk, steps, ctx):
+    """
+    Applies the operations named in steps, in order, to a chunk
+
+    Parameters
+    -----------
+    chunk: dict
+        Columns of the chunk, as arrays or lists keyed by column name
+    steps: list
+        Names of the operations, keys of OPERATIONS
+    ctx: dict
+        Settings of the operations: 'elip' and 'target' (instances of the
+        Ellipsoid class) and the names of the 'lat', 'lon' and 'h' columns
+
+    Returns
+    ---------
+    dict
+        The chunk with the new or updated columns
+    """
+    ctx = dict(ctx)
+    for step in steps:
+        OPERATIONS[step](chunk, ctx)
+    return chunk
+
+
+def _is_parquet(path):
+    return os.path.splitext(path)[1].lower() in ('.parquet', '.pq')
+
+
+def read_chunks(path, chunk_size):
+    """
+    Yields the rows of a CSV or Parquet file as dictionaries of columns with
+    at most chunk_size rows each. CSV columns are lists of strings; the
+    operations convert the columns they read. A file with a header (or
+    schema) but no rows yields one empty chunk, so the output still gets its
+    columns.
+    """
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+        infile = pq.ParquetFile(path)
+        empty = True
+        for batch in infile.iter_batches(batch_size=chunk_size):
+            empty = False
+            yield {name: col.to_numpy(zero_copy_only=False) for name, col in zip(batch.schema.names, batch.columns)}
+        if empty:
+            table = infile.schema_arrow.empty_table()
+            yield {name: col.to_numpy() for name, col in zip(table.column_names, table.columns)}
+        return
+    with open(path, newline='') as infile:
+        reader = csv.reader(infile)
+        header = next(reader, None)
+        if not header:
+            raise ValueError("{} has no header".format(path))
+        empty = True
+        while True:
+            rows = list(islice(reader, chunk_size))
+            if not rows:
+                break
+            empty = False
+            yield dict(zip(header, map(list, zip(*rows))))
+        if empty:
+            yield {name: [] for name in header}
+
+
+def _arrow_column(values):
+    import pyarrow as pa
+    # Columns passed through from a CSV input are lists of strings and stay as
+    # text; typing them is left to the reader of the output
+    if isinstance(values, list):
+        return pa.array(values, type=pa.string())
+    return pa.array(values)
+
+
+class ChunkWriter(object):
+    """
+    Writes chunks to a CSV or Parquet file, one after the other. The columns
+    are fixed by the first chunk. In Parquet output, the columns computed by
+    the operations are numeric, while the columns passed through from a CSV
+    input are written as strings.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.columns = None
+        self._file = None
+        self._writer = None
+
+    def write(self, chunk):
+        if self.columns is None:
+            self.columns = list(chunk)
+            if _is_parquet(self.path):
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+                self._schema = pa.table({c: _arrow_column(chunk[c]) for c in self.columns}).schema
+                self._writer = pq.ParquetWriter(self.path, self._schema)
+            else:
+                self._file = open(self.path, 'w', newline='')
+                self._writer = csv.writer(self._file)
+                self._writer.writerow(self.columns)
+        if self._file is None:
+            import pyarrow as pa
+            self._writer.write_table(pa.table({c: _arrow_column(chunk[c]) for c in self.columns}, schema=self._schema))
+        else:
+            cols = [c.tolist() if isinstance(c, np.ndarray) else c for c in (chunk[c] for c in self.columns)]
+            self._writer.writerows(zip(*cols))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        elif self._writer is not None:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def run(input_path, output_path, steps, ctx, chunk_size=100000, jobs=1):
+    """
+    Streams a CSV or Parquet file through a chain of operations. Only one
+    chunk per worker (plus one being read) is held in memory, so the peak
+    memory does not depend on the file size. The output keeps the input
+    order, and is created even when the input has no rows. Columns passed
+    through from a CSV input to a Parquet output stay as text.
+
+    Parameters
+    -----------
+    input_path: str
+        Input file (.csv, or .parquet/.pq if pyarrow is installed)
+    output_path: str
+        Output file, in the same formats
+    steps: list
+        Names of the operations, keys of OPERATIONS
+    ctx: dict
+        Settings of the operations, see process_chunk
+    chunk_size: int
+        Number of rows of each chunk
+    jobs: int
+        Number of worker processes
+
+    Returns
+    ---------
+    int
+        Number of rows written
+    """
+    for step in steps:
+        if step not in OPERATIONS:
+            raise ValueError("unknown operation '{}'. Available: {}".format(step, ", ".join(OPERATIONS)))
+    rows = 0
+    chunks = read_chunks(input_path, chunk_size)
+    with ChunkWriter(output_path) as writer:
+        if jobs == 1:
+            for chunk in chunks:
+                chunk = process_chunk(chunk, steps, ctx)
+                writer.write(chunk)
+                rows += len(next(iter(chunk.values())))
+            return rows
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(process_chunk, chunk, steps, ctx))
+                if len(pending) >= jobs:
+                    chunk = pending.popleft().result()
+                    writer.write(chunk)
+                    rows += len(next(iter(chunk.values())))
+            while pending:
+                chunk = pending.popleft().result()
+                writer.write(chunk)
+                rows += len(next(iter(chunk.values())))
+    return rows
@@ -0,0 +1,259 @@
+"""
+Benchmark harness for the public conversion and geodesic functions.
+
+Every function runs on fixed-seed synthetic datasets, in scalar mode (one
+Python call per point) and in batch mode (one call for the whole array). For
+each case it records the throughput (points per second), the latency of one
+call (of one point in scalar mode, of the whole array in batch mode), the
+time per point and the peak memory traced by tracemalloc. The results are saved as JSON and can be
+compared against a previous run:
+
+    python benchmarks.py -o before.json
+    python benchmarks.py -o after.json --compare before.json
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from coordinate_conv import dms2degrees, degrees2dms, parse_dms, geod2cart, cart2geod
+from datum_conv import conv_geod_datum, DatumTransformer
+from dist_sphere import dist_sphere, dist_sphere_from
+from distance_matrix import distance_matrix
+from ellipsoid import get_ellipsoid
+from gravity import normal_gravity, free_air_correction, reduce_survey, geopotential_numbers, C
+from miscellaneous_conv import astrloc2geodloc, geodloc2astrloc, local_frame
+from spatial_index import GeodeticIndex
+from vincenty_dist_formulae import inverse_problem, inverse_problem_batch, problema_direto, problema_direto_batch
+
+SEED = 20200101
+SIZES = (1, 1000, 1000000)
+# Scalar mode runs at most this many calls; the throughput is extrapolated
+MAX_SCALAR_CALLS = 2000
+# Points per side of the distance matrices and queries per index search, so
+# the quadratic cases stay bounded at the largest sizes
+MAX_MATRIX_POINTS = 2000
+MAX_QUERIES = 1000
+
+
+def make_datasets(n, seed=SEED):
+    """
+    Synthetic datasets of n points (or pairs of points), always the same
+    for the same n and seed
+    """
+    rng = np.random.default_rng(seed)
+    phi1, lamb1 = rng.uniform(-89, 89, n), rng.uniform(-180, 180, n)
+    # Global random pairs
+    datasets = {'global': (phi1, lamb1, rng.uniform(-89, 89, n), rng.uniform(-180, 180, n))}
+    # Short baselines, up to about 10 km
+    datasets['short'] = (phi1, lamb1, phi1 + rng.uniform(-0.05, 0.05, n), lamb1 + rng.uniform(-0.05, 0.05, n))
+    # Nearly antipodal pairs, the worst case of the inverse problem
+    datasets['antipodal'] = (phi1, lamb1, -phi1 + rng.uniform(-0.5, 0.5, n),
+                             lamb1 + 180 + rng.uniform(-0.5, 0.5, n))
+    # Dense local cluster around a single point
+    phi_c, lamb_c = -23.55 + rng.normal(0, 0.01, n), -46.63 + rng.normal(0, 0.01, n)
+    datasets['cluster'] = (phi_c, lamb_c, phi_c[::-1].copy(), lamb_c[::-1].copy())
+    datasets['h'] = rng.uniform(-100, 3000, n)
+    datasets['azimuth'] = rng.uniform(0, 360, n)
+    datasets['distance'] = rng.uniform(0, 1.0E7, n)
+    datasets['gobs'] = rng.uniform(977800, 978700, n)
+    return datasets
+
+
+def _scalar(func, *columns):
+    """
+    Returns a callable that calls func once per point, up to MAX_SCALAR_CALLS
+    points, and the number of points it processes
+    """
+    k = min(columns[0].size, MAX_SCALAR_CALLS)
+    rows = list(zip(*(c[:k].tolist() for c in columns)))
+    return (lambda: [func(*row) for row in rows]), k
+
+
+def make_cases(data, elip, elip2):
+    """
+    List of (function name, dataset, mode, callable, points per call)
+    """
+    n = data['h'].size
+    cases = []
+    for name in ('global', 'short', 'antipodal', 'cluster'):
+        # The loop values are bound as defaults: a plain closure would see the
+        # variables rebound further down and time the wrong dataset
+        phi1, lamb1, phi2, lamb2 = data[name]
+        cases += [('inverse_problem', name, 'scalar') + _scalar(lambda *p: inverse_problem(*p, elip),
+                                                                 phi1, lamb1, phi2, lamb2),
+                  ('inverse_problem_batch', name, 'batch',
+                   lambda phi1=phi1, lamb1=lamb1, phi2=phi2, lamb2=lamb2:
+                   inverse_problem_batch(phi1, lamb1, phi2, lamb2, elip), n),
+                  ('dist_sphere', name, 'scalar') + _scalar(lambda *p: dist_sphere(*p, 6371000.0),
+                                                             phi1, lamb1, phi2, lamb2),
+                  ('dist_sphere', name, 'batch',
+                   lambda phi1=phi1, lamb1=lamb1, phi2=phi2, lamb2=lamb2:
+                   dist_sphere(phi1, lamb1, phi2, lamb2, 6371000.0), n),
+                  ('dist_sphere[haversine]', name, 'batch',
+                   lambda phi1=phi1, lamb1=lamb1, phi2=phi2, lamb2=lamb2:
+                   dist_sphere(phi1, lamb1, phi2, lamb2, 6371000.0, method="haversine"), n)]
+
+    phi, lamb = data['global'][:2]
+    h, az, s, gobs = data['h'], data['azimuth'], data['distance'], data['gobs']
+    X, Y, Z = geod2cart(lamb, phi, h, elip)
+    d, m, sec = degrees2dms(phi)
+    dms_text = ["{:.0f}°{:.0f}'{:.3f}\"{}".format(abs(a), b, c, 'S' if a < 0 else 'N')
+                for a, b, c in zip(d[:100000], m[:100000], sec[:100000])]
+    frame = local_frame(-46.63, -23.55)
+    xyz = np.column_stack((X, Y, Z))
+    enu = frame.to_enu(xyz[:MAX_SCALAR_CALLS]).T
+    transformer = DatumTransformer(elip, elip2)
+    # Levelling line in the layout read by C: height differences and gravity
+    levelling = {'Dn(i-1->i) (m)': h / 1000, 'Gravidade (mgal)': gobs}
+    for name in ('global', 'cluster'):
+        phi1, lamb1 = data[name][:2]
+        cases.append(('dist_sphere_from', name, 'batch',
+                      lambda phi1=phi1, lamb1=lamb1: dist_sphere_from(-23.55, -46.63, phi1, lamb1, 6371000.0), n))
+    cases.append(('dist_sphere_from', 'global', 'scalar')
+                 + _scalar(lambda *p: dist_sphere_from(-23.55, -46.63, *p, 6371000.0), *data['global'][:2]))
+    cases += [
+        ('problema_direto', 'global', 'scalar') + _scalar(lambda *p: problema_direto(*p, elip), phi, lamb, az, s),
+        ('problema_direto_batch', 'global', 'batch', lambda: problema_direto_batch(phi, lamb, az, s, elip), n),
+        ('geod2cart', 'global', 'scalar') + _scalar(lambda *p: geod2cart(*p, elip), lamb, phi, h),
+        ('geod2cart', 'global', 'batch', lambda: geod2cart(lamb, phi, h, elip), n),
+        ('cart2geod', 'global', 'scalar') + _scalar(lambda *p: cart2geod(*p, elip), X, Y, Z),
+    ]
+    for method in ('bowring', 'iterative', 'vermeille'):
+        cases.append(('cart2geod[{}]'.format(method), 'global', 'batch',
+                      lambda method=method: cart2geod(X, Y, Z, elip, method=method), n))
+    cases += [
+        ('conv_geod_datum', 'global', 'scalar') + _scalar(lambda *p: conv_geod_datum(*p, elip, elip2), lamb, phi, h),
+        ('conv_geod_datum', 'global', 'batch', lambda: conv_geod_datum(lamb, phi, h, elip, elip2), n),
+        ('degrees2dms', 'global', 'scalar') + _scalar(degrees2dms, phi),
+        ('degrees2dms', 'global', 'batch', lambda: degrees2dms(phi), n),
+        ('dms2degrees', 'global', 'scalar') + _scalar(lambda *p: dms2degrees(p), d, m, sec),
+        ('dms2degrees', 'global', 'batch', lambda: dms2degrees([d, m, sec]), n),
+        ('parse_dms', 'global', 'batch', lambda: parse_dms(dms_text), len(dms_text)),
+        ('normal_gravity', 'global', 'scalar') + _scalar(lambda p: normal_gravity(p, elip), phi),
+        ('normal_gravity', 'global', 'batch', lambda: normal_gravity(phi, elip), n),
+        ('free_air_correction', 'global', 'scalar') + _scalar(lambda *p: free_air_correction(*p, elip), phi, h),
+        ('free_air_correction', 'global', 'batch', lambda: free_air_correction(phi, h, elip), n),
+        ('reduce_survey', 'global', 'batch', lambda: reduce_survey(phi, h, gobs, elip), n),
+        ('C', 'global', 'scalar') + _scalar(lambda i: C(levelling, i), np.arange(n)),
+        ('geopotential_numbers', 'global', 'batch', lambda: geopotential_numbers(h / 1000, gobs), n),
+        ('astrloc2geodloc', 'global', 'scalar') + _scalar(lambda *p: astrloc2geodloc(0, 0, 0, *p, -46.63, -23.55),
+                                                          X, Y, Z),
+        ('geodloc2astrloc', 'global', 'scalar') + _scalar(lambda *p: geodloc2astrloc(*p, -46.63, -23.55),
+                                                          enu[0], enu[1], enu[2]),
+        ('LocalFrame.to_enu', 'global', 'batch', lambda: frame.to_enu(xyz), n),
+        ('DatumTransformer.transform', 'global', 'batch', lambda: transformer.transform(lamb, phi, h), n),
+    ]
+    # Matrices of k x k pairs, over spread and clustered points
+    k = min(n, MAX_MATRIX_POINTS)
+    for name in ('global', 'cluster'):
+        points = np.column_stack(data[name][:2])[:k]
+        for method in ('sphere', 'vincenty'):
+            cases.append(('distance_matrix[{}]'.format(method), name, 'batch',
+                          lambda points=points, method=method: distance_matrix(points, method=method, elip=elip),
+                          k*k))
+    # Index over the whole dataset, searched from a bounded number of points
+    q = min(n, MAX_QUERIES)
+    q_phi, q_lamb = data['global'][2][:q], data['global'][3][:q]
+    index = GeodeticIndex(phi, lamb, elip)
+    cases += [
+        ('GeodeticIndex', 'global', 'batch', lambda: GeodeticIndex(phi, lamb, elip), n),
+        ('GeodeticIndex.query_radius', 'global', 'batch', lambda: index.query_radius(q_phi, q_lamb, 100000.0), q),
+        ('GeodeticIndex.query_knn', 'global', 'batch', lambda: index.query_knn(q_phi, q_lamb, min(8, n)), q),
+    ]
+    return cases
+
+
+def measure(func, points, repeat=3, calls=1):
+    """
+    Runs func, which makes calls calls over points points, repeat times and
+    returns the best wall time, the throughput in points per second, the
+    latency of one call, the time per point and the peak memory of one traced
+    run
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    best = min(times)
+    return {'seconds': best, 'points': points, 'calls': calls,
+            'throughput': points / best if best > 0 else float('inf'),
+            'latency': best / calls, 'time_per_point': best / points, 'peak_memory': peak}
+
+
+def run(sizes=SIZES, repeat=3, only=None):
+    """
+    Runs every case for every size and returns the results as a dictionary
+    """
+    elip, elip2 = get_ellipsoid("SIRGAS2000"), get_ellipsoid("SAD69")
+    results = {'meta': {'python': sys.version.split()[0], 'numpy': np.__version__, 'platform': platform.platform(),
+                        'seed': SEED, 'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+               'results': []}
+    for n in sizes:
+        data = make_datasets(n)
+        for name, dataset, mode, func, points in make_cases(data, elip, elip2):
+            if only and not any(o in name for o in only):
+                continue
+            # Scalar cases make one call per point, batch cases a single call
+            result = measure(func, points, repeat, calls=points if mode == 'scalar' else 1)
+            result.update(function=name, dataset=dataset, mode=mode, size=n)
+            results['results'].append(result)
+            print("{:<24} {:<10} {:<7} n={:<8} {:>14.0f} pts/s {:>10.3g} s/call {:>10.3g} s/pt {:>10.1f} KiB".format(
+                name, dataset, mode, n, result['throughput'], result['latency'], result['time_per_point'],
+                result['peak_memory'] / 1024))
+    return results
+
+
+def compare(results, baseline, threshold=0.2):
+    """
+    Lists the cases whose throughput dropped by more than threshold (a
+    fraction) from the baseline results
+
+    Returns
+    --------
+    list
+        (function, dataset, mode, size, relative change) of each regression
+    """
+    key = lambda r: (r['function'], r['dataset'], r['mode'], r['size'])
+    before = {key(r): r for r in baseline['results']}
+    regressions = []
+    for r in results['results']:
+        if key(r) in before:
+            change = r['throughput'] / before[key(r)]['throughput'] - 1
+            if change < -threshold:
+                regressions.append(key(r) + (change,))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the geodesy functions")
+    parser.add_argument("-o", "--output", default="bench_output.json", help="JSON file for the results")
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)), help="comma separated dataset sizes")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the best one is kept")
+    parser.add_argument("--only", nargs="+", help="run only the functions whose names contain these strings")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="throughput drop flagged as regression")
+    args = parser.parse_args(argv)
+
+    results = run([int(float(s)) for s in args.sizes.split(",")], args.repeat, args.only)
+    with open(args.output, "w") as outfile:
+        json.dump(results, outfile, indent=1)
+    if args.compare:
+        with open(args.compare) as infile:
+            regressions = compare(results, json.load(infile), args.threshold)
+        for function, dataset, mode, size, change in regressions:
+            print("REGRESSION {} {} {} n={}: {:+.1%}".format(function, dataset, mode, size, change))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
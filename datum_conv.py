@@ -1,12 +1,184 @@
+import os
+
+import numpy as np
+import reference_data
 from coordinate_conv import geod2cart, cart2geod
+from ellipsoid import get_ellipsoid
+from instrumentation import instrumented
+
+PARAMETERS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "conversion_parameters.dat")
+
+_parameters = None
+_transformers = {}
+
+
+def load_parameters(filename=PARAMETERS_FILE):
+    """
+    Reads the conversion parameters file. Each line holds the conversion name
+    (source + '2' + target), the translations dx, dy and dz in meters and,
+    optionally, the rotations rx, ry and rz in arc seconds and the scale
+    factor ds in ppm of a 7-parameter Helmert transformation (position vector
+    convention).
+
+    Parameters
+    -----------
+    filename: str
+        Path of the parameters file. Defaults to the file shipped next to
+        this module
+
+    Returns
+    ---------
+    dict
+        Parameters of each conversion, keyed by the conversion name
+    """
+    parameters = {}
+    with open(filename) as infile:
+        for n, line in enumerate(infile):
+            fields = line.split()
+            if n == 0 or not fields:
+                continue
+            values = [float(v) for v in fields[1:]] + [0.0]*(8 - len(fields))
+            parameters[fields[0]] = dict(zip(('dx', 'dy', 'dz', 'rx', 'ry', 'rz', 'ds'), values))
+    return parameters
+
+
+def _get_parameters():
+    global _parameters
+    if _parameters is None:
+        _parameters = reference_data.load(PARAMETERS_FILE, load_parameters)
+    return _parameters
+
+
+def _name(elip):
+    """
+    Datum name of an Ellipsoid or a name. The conversion parameters are keyed
+    by datum name, so unnamed ellipsoids cannot be converted
+    """
+    name = elip if isinstance(elip, str) else elip.name
+    if name is None:
+        raise ValueError("the ellipsoid has no name; use a datum from ellipsoid.txt, e.g. get_ellipsoid('SAD69')")
+    return name
+
+
+def _ellipsoid(elip):
+    return get_ellipsoid(elip) if isinstance(elip, str) else elip
+
+
+class DatumTransformer(object):
+    """
+    A class used to transform coordinate arrays between two geodetic datums.
+    The Helmert parameters of every step are folded into a single affine
+    transformation of the Cartesian coordinates, X2 = M X1 + T, so chained
+    conversions never go back to geodetic coordinates between steps.
+    For initialization, it requires:
+    elip1 -> Ellipsoid (or datum name) of the source datum
+    elip2 -> Ellipsoid (or datum name) of the target datum
+    Optionally, it takes:
+    via -> sequence of intermediate datums (Ellipsoid instances or names)
+    """
+
+    def __init__(self, elip1, elip2, via=()):
+        """
+        Parameters
+        ----------
+        elip1 : object
+            Instance of the Ellipsoid class related to the origin coordinates.
+            A datum name is resolved with get_ellipsoid
+        elip2 : object
+            Instance of the Ellipsoid class related to the converted coordinates.
+            A datum name is resolved with get_ellipsoid
+        via : sequence
+            Intermediate datums, as Ellipsoid instances or names
+        M : ndarray
+            3x3 matrix with the rotation and scale of the whole chain
+        T : ndarray
+            Translation of the whole chain in meters
+        ---------
+        """
+        self.elip1 = _ellipsoid(elip1)
+        self.elip2 = _ellipsoid(elip2)
+        names = [_name(elip1)] + [_name(e) for e in via] + [_name(elip2)]
+        parameters = _get_parameters()
+        self.M = np.eye(3)
+        self.T = np.zeros(3)
+        for source, target in zip(names[:-1], names[1:]):
+            modo = source + '2' + target
+            if modo not in parameters:
+                raise ValueError("No conversion parameters from {} to {}".format(source, target))
+            p = parameters[modo]
+            rx, ry, rz = np.radians(np.array([p['rx'], p['ry'], p['rz']])/3600)
+            M = (1 + p['ds']*1.0E-6)*np.array([[1, -rz, ry],
+                                               [rz, 1, -rx],
+                                               [-ry, rx, 1]])
+            self.M = M @ self.M
+            self.T = M @ self.T + np.array([p['dx'], p['dy'], p['dz']])
+
+    def transform_cart(self, X, Y, Z):
+        """
+        Transforms Cartesian coordinates from the source to the target datum
+
+        Parameters
+        ----------
+        X, Y, Z : float or array_like
+            Cartesian coordinates in the source datum, in meters
+
+        Returns
+        ---------
+        float or ndarray
+            X, Y and Z in the target datum, in meters
+        """
+        M, T = self.M, self.T
+        X2 = M[0, 0]*X + M[0, 1]*Y + M[0, 2]*Z + T[0]
+        Y2 = M[1, 0]*X + M[1, 1]*Y + M[1, 2]*Z + T[1]
+        Z2 = M[2, 0]*X + M[2, 1]*Y + M[2, 2]*Z + T[2]
+        return X2, Y2, Z2
+
+    @instrumented("DatumTransformer.transform", size_arg=1)
+    def transform(self, lamb, phi, h):
+        """
+        Transforms geodetic coordinates from the source to the target datum
+
+        Parameters
+        ----------
+        lamb : float or array_like
+            Longitude in degrees
+        phi : float or array_like
+            Latitude in degrees
+        h : float or array_like
+            Geometric altitude in meters
+
+        Returns
+        ---------
+        float or ndarray
+            Converted longitude in degrees
+        float or ndarray
+            Converted latitude in degrees
+        float or ndarray
+            Converted geometric altitude in meters
+        """
+        X, Y, Z = geod2cart(lamb, phi, h, self.elip1)
+        return cart2geod(*self.transform_cart(X, Y, Z), self.elip2)
+
+
+def get_transformer(elip1, elip2, via=()):
+    """
+    Returns the DatumTransformer for the given datums, building it only on
+    the first request. It is built again when the ellipsoids or the
+    conversion parameters registered under those names change
+    """
+    key = (_name(elip1), tuple(_name(e) for e in via), _name(elip2))
+    names = (key[0],) + key[1] + (key[2],)
+    parameters = _get_parameters()
+    source, target = _ellipsoid(elip1), _ellipsoid(elip2)
+    signature = ((source.a, source.f), (target.a, target.f),
+                 tuple(tuple(sorted(parameters.get(a + '2' + b, {}).items())) for a, b in zip(names[:-1], names[1:])))
+    cached = _transformers.get(key)
+    if cached is None or cached[0] != signature:
+        cached = _transformers[key] = (signature, DatumTransformer(elip1, elip2, via))
+    return cached[1]
 
-parameters = {}
-with open("conversion_parameters.dat") as infile:
-    for n, line in enumerate(infile):
-        if n != 0:
-            conv, dx, dy, dz = line.split()[0], float(line.split()[1]), float(line.split()[2]), float(line.split()[3])
-            parameters[conv] = {'dx': dx, 'dy': dy, 'dz': dz}
 
+@instrumented("conv_geod_datum")
 def conv_geod_datum(lamb, phi, h, elip1, elip2, dms=False):
     """
     Converts coordinates between different geodetic datums. Conversion parameters defined until now:
@@ -17,11 +189,11 @@ def conv_geod_datum(lamb, phi, h, elip1, elip2, dms=False):
 
     Parameters
     -----------
-    lamb: float
+    lamb: float or array_like
         Longitude in degrees
-    phi: float
+    phi: float or array_like
         Latitude in degrees
-    h: float
+    h: float or array_like
         Geometric altitude in degrees
     elip1: object
         Instance of the Ellipsoid class related to the origin coordinates
@@ -37,10 +209,4 @@ def conv_geod_datum(lamb, phi, h, elip1, elip2, dms=False):
     h
         Converted geometric altitude in meters
     """
-    X, Y, Z = geod2cart(lamb, phi, h, elip1)
-    ####### FIX THIS ############
-    modo = elip1.nome + '2' + elip2.nome
-    ##########################
-    X2, Y2, Z2 = X + parameters[modo]['dx'], Y + \
-        parameters[modo]['dy'], Z + parameters[modo]['dz']
-    return cart2geod(X2, Y2, Z2, elip2)
+    return get_transformer(elip1, elip2).transform(lamb, phi, h)
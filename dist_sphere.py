@@ -1,30 +1,116 @@
+import math
+
 import numpy as np
 
-def dist_sphere(phi1, lamb1, phi2, lamb2, R):
+METHODS = ("cosines", "haversine", "vincenty")
+
+
+def _central_angle(method, phi1, sin1, cos1, phi2, sin2, cos2, dlamb):
+    """
+    Central angle in radians between two points, given their latitudes (in
+    radians), the sines and cosines of the latitudes and the longitude
+    difference (in radians)
+    """
+    if method == "cosines":
+        # Law of cosines: ill-conditioned for short distances
+        S = sin1*sin2 + cos1*cos2*np.cos(dlamb)
+        return np.arccos(np.clip(S, -1, 1, out=S if isinstance(S, np.ndarray) else None))
+    if method == "haversine":
+        # Well conditioned except for nearly antipodal points
+        hav = np.sin((phi2 - phi1)/2)**2 + cos1*cos2*np.sin(dlamb/2)**2
+        return 2*np.arcsin(np.sqrt(np.clip(hav, 0, 1)))
+    if method == "vincenty":
+        # Well conditioned for every distance
+        sin_dl, cos_dl = np.sin(dlamb), np.cos(dlamb)
+        return np.arctan2(np.hypot(cos2*sin_dl, cos1*sin2 - sin1*cos2*cos_dl), sin1*sin2 + cos1*cos2*cos_dl)
+    raise ValueError("method must be one of {}".format(", ".join(METHODS)))
+
+
+def dist_sphere(phi1, lamb1, phi2, lamb2, R, method="cosines", dtype=None, out=None):
     """
     Calculates the distance between two points on a sphere
 
     Parameters
     -----------
-    phi1: float
+    phi1: float or array_like
         Latitude of point 1
-    lamb1: float
+    lamb1: float or array_like
         Latitude of point 1
-    phi2: float
+    phi2: float or array_like
         Latitude of point 2
-    lamb2: float
+    lamb2: float or array_like
         Longitude of point 2
     R: float or int
         Earth radius
+    method: str
+        "cosines" (spherical law of cosines), "haversine" or "vincenty"
+        (Vincenty's formula for the sphere, accurate for every distance)
+    dtype: data-type
+        Data type used in the computation and in the result, e.g. np.float32.
+        Defaults to float64
+    out: ndarray
+        Optional array, with the broadcast shape of the inputs, where the
+        result is stored
 
     Returns
     --------
-    float
+    float or ndarray
         Distance between the two points over a sphere of radius R
     """
-    phi1, lamb1 = np.deg2rad(phi1), np.deg2rad(lamb1)
-    phi2, lamb2 = np.deg2rad(phi2), np.deg2rad(lamb2)
-    S = np.arccos(np.sin(phi1)*np.sin(phi2)+np.cos(phi1)
-                  * np.cos(phi2)*np.cos(lamb2-lamb1))
-    Se = R*S
+    dtype = np.dtype(np.float64 if dtype is None else dtype)
+    phi1 = np.deg2rad(np.asarray(phi1, dtype=dtype))
+    phi2 = np.deg2rad(np.asarray(phi2, dtype=dtype))
+    dlamb = np.deg2rad(np.subtract(lamb2, lamb1, dtype=dtype))
+    S = _central_angle(method, phi1, np.sin(phi1), np.cos(phi1), phi2, np.sin(phi2), np.cos(phi2), dlamb)
+    Se = np.multiply(S, dtype.type(R), out=out)
     return Se
+
+
+def dist_sphere_from(phi0, lamb0, phi, lamb, R, method="haversine", sin_phi=None, cos_phi=None, dtype=None,
+                     out=None):
+    """
+    Calculates the distances from one fixed point to many points on a sphere.
+    The trigonometric functions of the fixed point are computed once, and
+    those of the batch latitudes can be computed once and passed in, so that
+    they are reused across several fixed points.
+
+    Parameters
+    -----------
+    phi0: float
+        Latitude of the fixed point
+    lamb0: float
+        Longitude of the fixed point
+    phi: array_like
+        Latitudes of the other points
+    lamb: array_like
+        Longitudes of the other points
+    R: float or int
+        Earth radius
+    method: str
+        "cosines", "haversine" or "vincenty", see dist_sphere
+    sin_phi: array_like
+        Optional np.sin(np.deg2rad(phi)), needed by "cosines" and "vincenty"
+    cos_phi: array_like
+        Optional np.cos(np.deg2rad(phi))
+    dtype: data-type
+        Data type used in the computation and in the result. Defaults to
+        float64
+    out: ndarray
+        Optional array, with the shape of phi, where the result is stored
+
+    Returns
+    --------
+    ndarray
+        Distances from the fixed point over a sphere of radius R
+    """
+    dtype = np.dtype(np.float64 if dtype is None else dtype)
+    phi0_rad = math.radians(phi0)
+    phi = np.deg2rad(np.asarray(phi, dtype=dtype))
+    if cos_phi is None:
+        cos_phi = np.cos(phi)
+    if sin_phi is None and method != "haversine":
+        sin_phi = np.sin(phi)
+    dlamb = np.deg2rad(np.subtract(lamb, dtype.type(lamb0), dtype=dtype))
+    S = _central_angle(method, dtype.type(phi0_rad), dtype.type(math.sin(phi0_rad)),
+                       dtype.type(math.cos(phi0_rad)), phi, sin_phi, cos_phi, dlamb)
+    return np.multiply(S, dtype.type(R), out=out)
@@ -0,0 +1,136 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from dist_sphere import dist_sphere
+from vincenty_dist_formulae import inverse_problem_batch
+
+# Shared by the worker processes, set once by _init_worker
+_state = {}
+
+
+def _tiles(n_a, n_b, tile_size, symmetric):
+    """
+    Yields (row_start, row_stop, col_start, col_stop) for every tile of the
+    matrix. When the matrix is symmetric only tiles on or above the diagonal
+    are produced.
+    """
+    for i in range(0, n_a, tile_size):
+        for j in range(i if symmetric else 0, n_b, tile_size):
+            yield i, min(i + tile_size, n_a), j, min(j + tile_size, n_b)
+
+
+def _compute_tile(pa, pb, method, elip, R):
+    """
+    Distances between every point of pa (rows) and pb (columns)
+    """
+    if method == "sphere":
+        # Haversine keeps its precision at short distances, where the cosines
+        # formula loses it
+        return dist_sphere(pa[:, 0, None], pa[:, 1, None], pb[None, :, 0], pb[None, :, 1], R, method="haversine")
+    s, _, _, _ = inverse_problem_batch(pa[:, 0, None], pa[:, 1, None], pb[None, :, 0], pb[None, :, 1], elip)
+    return s
+
+
+def _fill_tile(out, tile, i0, i1, j0, j1, symmetric):
+    out[i0:i1, j0:j1] = tile
+    if symmetric and i0 != j0:
+        out[j0:j1, i0:i1] = tile.T
+    elif symmetric:
+        # Diagonal tile: d(p, p) is exactly zero, whatever the rounding of the formula
+        np.fill_diagonal(out[i0:i1, j0:j1], 0)
+
+
+def _init_worker(points_a, points_b, method, elip, R, filename, dtype, shape):
+    _state.update(points_a=points_a, points_b=points_b, method=method, elip=elip, R=R)
+    if filename is not None:
+        _state['out'] = np.memmap(filename, dtype=dtype, mode='r+', shape=shape)
+
+
+def _worker(args):
+    i0, i1, j0, j1, symmetric = args
+    tile = _compute_tile(_state['points_a'][i0:i1], _state['points_b'][j0:j1],
+                         _state['method'], _state['elip'], _state['R'])
+    if 'out' in _state:
+        _fill_tile(_state['out'], tile.astype(_state['out'].dtype), i0, i1, j0, j1, symmetric)
+        return None
+    return tile
+
+
+def distance_matrix(points_a, points_b=None, method="sphere", elip=None, R=6371000.0, dtype=np.float64,
+                    tile_size=512, n_jobs=1, out=None):
+    """
+    Calculates the distances between every point of points_a and every point
+    of points_b. The matrix is filled in square tiles of tile_size points,
+    which can be spread over a pool of processes.
+
+    Parameters
+    -----------
+    points_a: array_like
+        Array of shape (N, 2) with the latitude and longitude of each point in
+        decimal degrees
+    points_b: array_like
+        Array of shape (M, 2) in the same format. If omitted (or if it is the
+        same object as points_a) the matrix is symmetric and only the tiles on
+        or above the diagonal are computed
+    method: str
+        "sphere" for the distance over a sphere of radius R or "vincenty" for
+        the ellipsoidal distance given by inverse_problem_batch
+    elip: object
+        Instance of the Ellipsoid class, required by the "vincenty" method
+    R: float or int
+        Earth radius used by the "sphere" method, which uses the haversine
+        formula
+    dtype: data-type
+        Data type of the output matrix
+    tile_size: int
+        Number of rows and columns of each tile
+    n_jobs: int
+        Number of worker processes. Use None for one per CPU
+    out: str or ndarray
+        Optional output. If it is a file name, the matrix is written to a
+        memory-mapped file so it never has to fit in memory
+
+    Returns
+    --------
+    ndarray or memmap
+        Matrix of shape (N, M) with the distances in meters
+    """
+    if method not in ("sphere", "vincenty"):
+        raise ValueError("method must be 'sphere' or 'vincenty'")
+    if method == "vincenty" and elip is None:
+        raise ValueError("the 'vincenty' method requires an ellipsoid")
+
+    symmetric = points_b is None or points_b is points_a
+    points_a = np.asarray(points_a, dtype=float)
+    points_b = points_a if symmetric else np.asarray(points_b, dtype=float)
+    shape = (points_a.shape[0], points_b.shape[0])
+
+    filename = None
+    if isinstance(out, (str, os.PathLike)):
+        filename = out
+        out = np.memmap(filename, dtype=dtype, mode='w+', shape=shape)
+    elif out is None:
+        out = np.empty(shape, dtype=dtype)
+    elif out.shape != shape:
+        raise ValueError("out must have shape {}".format(shape))
+
+    tiles = [t + (symmetric,) for t in _tiles(shape[0], shape[1], tile_size, symmetric)]
+
+    if n_jobs == 1:
+        for i0, i1, j0, j1, sym in tiles:
+            tile = _compute_tile(points_a[i0:i1], points_b[j0:j1], method, elip, R)
+            _fill_tile(out, tile, i0, i1, j0, j1, sym)
+    else:
+        if filename is not None:
+            # The workers write their tiles straight into the file
+            out.flush()
+        initargs = (points_a, points_b, method, elip, R, filename, dtype, shape)
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=initargs) as pool:
+            for (i0, i1, j0, j1, sym), tile in zip(tiles, pool.map(_worker, tiles)):
+                if tile is not None:
+                    _fill_tile(out, tile, i0, i1, j0, j1, sym)
+
+    if filename is not None:
+        out.flush()
+    return out
@@ -1,15 +1,27 @@
-from numpy import sin, sqrt, radians
+import os
+
+from numpy import sin, cos, sqrt, radians
+import reference_data
+
+ELLIPSOIDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ellipsoid.txt")
+
+_registry = None
 
 
 class Ellipsoid(object):
     """
-    A class used to represent an ellipsoid.
+    A class used to represent an ellipsoid. Instances are immutable, and every
+    derived constant is computed once, on initialization.
     For initialization, it requires:
     a -> major semi-axis
     f -> flattening
+    Optionally, it takes:
+    name -> name of the ellipsoid (the datum name in ellipsoid.txt)
     """
 
-    def __init__(self, a, f):
+    __slots__ = ("a", "f", "name", "b", "e1", "e2", "e1_sq", "e2_sq", "n", "vincenty_coeffs", "arc_coeffs")
+
+    def __init__(self, a, f, name=None):
         """
         Parameters
         ----------
@@ -17,19 +29,66 @@ class Ellipsoid(object):
             Major semi-axis
         f : float
             Flattening
+        name : str
+            Name of the ellipsoid
         b : float
             Minor semi-axis
         e1 : float
             First eccentricity
         e2 : float
             Second eccentricity
+        e1_sq : float
+            First eccentricity squared
+        e2_sq : float
+            Second eccentricity squared
+        n : float
+            Third flattening, (a-b)/(a+b)
+        vincenty_coeffs : tuple
+            Constants (f/16, 4+4f, 3f) of Vincenty's C = f/16*cos²α*(4+f*(4-3cos²α))
+        arc_coeffs : tuple
+            Coefficients of the meridian arc series, see meridianArc
         ---------
         """
-        self.a = a
-        self.f = f
-        self.b = self.a - self.f*self.a
-        self.e1 = sqrt((self.a**2-self.b**2)/self.a**2)
-        self.e2 = sqrt((self.a**2-self.b**2)/self.b**2)
+        b = a - f*a
+        e1_sq = (a**2-b**2)/a**2
+        e2_sq = (a**2-b**2)/b**2
+        n = (a-b)/(a+b)
+        s = object.__setattr__
+        s(self, "a", a)
+        s(self, "f", f)
+        s(self, "name", name)
+        s(self, "b", b)
+        s(self, "e1", sqrt(e1_sq))
+        s(self, "e2", sqrt(e2_sq))
+        s(self, "e1_sq", e1_sq)
+        s(self, "e2_sq", e2_sq)
+        s(self, "n", n)
+        s(self, "vincenty_coeffs", (f/16, 4+4*f, 3*f))
+        s(self, "arc_coeffs", (a/(1+n)*(1 + n**2/4 + n**4/64),
+                               a/(1+n)*(3/2)*(n - n**3/8),
+                               a/(1+n)*(15/16)*(n**2 - n**4/4),
+                               a/(1+n)*(35/48)*n**3,
+                               a/(1+n)*(315/512)*n**4))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Ellipsoid instances are immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("Ellipsoid instances are immutable")
+
+    def __reduce__(self):
+        return (Ellipsoid, (self.a, self.f, self.name))
+
+    def __eq__(self, other):
+        if not isinstance(other, Ellipsoid):
+            return NotImplemented
+        return (self.a, self.f, self.name) == (other.a, other.f, other.name)
+
+    def __hash__(self):
+        return hash((self.a, self.f, self.name))
+
+    def __repr__(self):
+        return "Ellipsoid(a={!r}, f={!r}, name={!r})".format(self.a, self.f, self.name)
 
     def medirianNormal(self, phi):
         """
@@ -41,7 +100,7 @@ class Ellipsoid(object):
         phi : float
             Latitude in degrees
         """
-        mN = self.a/(sqrt(1-(self.e1**2)*sin(radians(phi))**2))
+        mN = self.a/(sqrt(1-self.e1_sq*sin(radians(phi))**2))
         return mN
 
     def equatorNormal(self, phi):
@@ -54,20 +113,103 @@ class Ellipsoid(object):
         phi : float
             Latitude in degrees
         """
-        eN = self.medirianNormal(phi)*(1-self.e1**2)
+        eN = self.medirianNormal(phi)*(1-self.e1_sq)
         return eN
 
+    def meridianRadius(self, phi):
+        """
+        Calculates the radius of curvature of the meridian at latitude phi
 
-def export_ellipsoids():
-    """
-    Returns a dictionary of ellipsoids from the ellipsoids.txt file
-    """
+        Parameters
+        ----------
+        phi : float
+            Latitude in degrees
+        """
+        return self.a*(1-self.e1_sq)/(sqrt(1-self.e1_sq*sin(radians(phi))**2))**3
+
+    def meanRadius(self, phi):
+        """
+        Calculates the Gaussian mean radius of curvature at latitude phi,
+        sqrt(M*N)
+
+        Parameters
+        ----------
+        phi : float
+            Latitude in degrees
+        """
+        return sqrt(self.meridianRadius(phi)*self.medirianNormal(phi))
+
+    def azimuthRadius(self, phi, alpha):
+        """
+        Calculates the radius of curvature of the normal section with azimuth
+        alpha at latitude phi (Euler's formula)
+
+        Parameters
+        ----------
+        phi : float
+            Latitude in degrees
+        alpha : float
+            Azimuth in degrees
+        """
+        M = self.meridianRadius(phi)
+        N = self.medirianNormal(phi)
+        return M*N/(M*sin(radians(alpha))**2 + N*cos(radians(alpha))**2)
 
-    with open("ellipsoid.txt") as file:
+    def meridianArc(self, phi):
+        """
+        Calculates the length of the meridian arc from the equator to the
+        latitude phi (Helmert's series, to the fourth power of n)
+
+        Parameters
+        ----------
+        phi : float
+            Latitude in degrees
+        """
+        phi = radians(phi)
+        A0, A2, A4, A6, A8 = self.arc_coeffs
+        return A0*phi - A2*sin(2*phi) + A4*sin(4*phi) - A6*sin(6*phi) + A8*sin(8*phi)
+
+
+def _load_registry(filename=ELLIPSOIDS_FILE):
+    with open(filename) as file:
         ellipsoid_dict = {}
         for line in file:
             a = float(line.split()[0])
             f_str_inv = line.split()[1].split("/")[1]
             f = 1/float(f_str_inv)
-            ellipsoid_dict[line.split()[-1]] = Ellipsoid(a, f)
+            ellipsoid_dict[line.split()[-1]] = Ellipsoid(a, f, line.split()[-1])
     return ellipsoid_dict
+
+
+def _get_registry():
+    global _registry
+    if _registry is None:
+        _registry = reference_data.load(ELLIPSOIDS_FILE, _load_registry)
+    return _registry
+
+
+def export_ellipsoids(filename=ELLIPSOIDS_FILE):
+    """
+    Returns a dictionary of ellipsoids from the ellipsoids.txt file. The
+    default file is parsed only on first use, and later loaded from its
+    binary cache (see reference_data).
+    """
+    if filename != ELLIPSOIDS_FILE:
+        return _load_registry(filename)
+    return dict(_get_registry())
+
+
+def get_ellipsoid(name):
+    """
+    Returns the ellipsoid with the given name from the ellipsoids.txt file
+
+    Parameters
+    ----------
+    name : str
+        Name of the ellipsoid, e.g. "WGS84"
+    """
+    registry = _get_registry()
+    try:
+        return registry[name]
+    except KeyError:
+        raise KeyError("Unknown ellipsoid '{}'. Available: {}".format(name, ", ".join(registry))) from None
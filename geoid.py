@@ -0,0 +1,261 @@
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+
+METHODS = ("bilinear", "bicubic")
+
+
+def _cache_paths(path):
+    base = os.path.splitext(path)[0]
+    return base + ".npy", base + ".json"
+
+
+def _convert_esri(infile, values_path):
+    """
+    Streams the rows of an ESRI ASCII grid (north to south) into a .npy file
+    stored south to north, and returns the grid header
+    """
+    header = {}
+    while len(header) < 6:
+        position = infile.tell()
+        line = infile.readline()
+        fields = line.split()
+        if not fields or not fields[0][0].isalpha():
+            infile.seek(position)
+            break
+        header[fields[0].lower()] = float(fields[1])
+    ncols, nrows = int(header['ncols']), int(header['nrows'])
+    step = header['cellsize']
+    # Corner registration is converted to the center of the cells
+    shift = 0.0 if 'xllcenter' in header else step/2
+    lon0 = header.get('xllcenter', header.get('xllcorner', 0.0) + shift)
+    lat0 = header.get('yllcenter', header.get('yllcorner', 0.0) + shift)
+    nodata = header.get('nodata_value')
+
+    values = np.lib.format.open_memmap(values_path, mode="w+", dtype=np.float32, shape=(nrows, ncols))
+    row, buffer = nrows - 1, []
+    for line in infile:
+        buffer.extend(line.split())
+        while len(buffer) >= ncols and row >= 0:
+            values[row] = np.array(buffer[:ncols], dtype=float)
+            del buffer[:ncols]
+            row -= 1
+    if nodata is not None:
+        values[values == np.float32(nodata)] = np.nan
+    values.flush()
+    return {'lat0': lat0, 'lon0': lon0, 'dlat': step, 'dlon': step, 'nrows': nrows, 'ncols': ncols}
+
+
+def _convert_xyz(infile, values_path):
+    """
+    Reads a regular grid given as lines of longitude, latitude and undulation
+    in any order, saves it as a .npy file and returns the grid header
+    """
+    lon, lat, N = np.loadtxt(infile, usecols=(0, 1, 2), unpack=True, ndmin=2)
+    lons, lats = np.unique(lon), np.unique(lat)
+    dlon = np.min(np.diff(lons)) if lons.size > 1 else 1.0
+    dlat = np.min(np.diff(lats)) if lats.size > 1 else 1.0
+    ncols = int(round((lons[-1] - lons[0])/dlon)) + 1
+    nrows = int(round((lats[-1] - lats[0])/dlat)) + 1
+    values = np.full((nrows, ncols), np.nan, dtype=np.float32)
+    values[np.rint((lat - lats[0])/dlat).astype(int), np.rint((lon - lons[0])/dlon).astype(int)] = N
+    np.save(values_path, values)
+    return {'lat0': lats[0], 'lon0': lons[0], 'dlat': dlat, 'dlon': dlon, 'nrows': nrows, 'ncols': ncols}
+
+
+def convert_grid(path, values_path=None):
+    """
+    Converts a geoid model in ESRI ASCII (.asc, .grd) or XYZ (any other
+    extension; longitude, latitude and undulation per line) format into the
+    binary cache read by GeoidGrid: a float32 .npy array, south to north and
+    west to east, plus a .json header.
+
+    Parameters
+    -----------
+    path: str
+        Path of the geoid model
+    values_path: str
+        Path of the .npy file. Defaults to the model path with the .npy
+        extension; the header goes next to it with the .json extension
+
+    Returns
+    ---------
+    str
+        Path of the .npy file
+    """
+    if values_path is None:
+        values_path = _cache_paths(path)[0]
+    with open(path) as infile:
+        if os.path.splitext(path)[1].lower() in (".asc", ".grd"):
+            header = _convert_esri(infile, values_path)
+        else:
+            header = _convert_xyz(infile, values_path)
+    with open(os.path.splitext(values_path)[0] + ".json", "w") as outfile:
+        json.dump(header, outfile)
+    return values_path
+
+
+def _cubic_weights(t):
+    """
+    Weights of the four nodes around t (0 <= t < 1) of the cubic convolution
+    kernel of Keys (a = -0.5), which reproduces a quadratic exactly
+    """
+    t2, t3 = t*t, t*t*t
+    return (-0.5*t3 + t2 - 0.5*t,
+            1.5*t3 - 2.5*t2 + 1,
+            -1.5*t3 + 2*t2 + 0.5*t,
+            0.5*t3 - 0.5*t2)
+
+
+class GeoidGrid(object):
+    """
+    A class used to represent a gridded geoid model. The undulations are read
+    from the binary cache written by convert_grid, memory-mapped, so only the
+    pages holding the nodes around the queried points are read from disk.
+    Grids covering 360 degrees of longitude wrap around.
+    For initialization, it requires:
+    values_path -> path of the .npy file written by convert_grid
+    """
+
+    def __init__(self, values_path):
+        """
+        Parameters
+        ----------
+        values_path : str
+            Path of the .npy file written by convert_grid
+        values : ndarray
+            Memory-mapped undulations in meters, south to north and west to east
+        lat0, lon0 : float
+            Latitude and longitude of the southwest node in degrees
+        dlat, dlon : float
+            Grid spacing in degrees
+        ---------
+        """
+        with open(os.path.splitext(values_path)[0] + ".json") as infile:
+            header = json.load(infile)
+        self.values = np.load(values_path, mmap_mode="r")
+        self.lat0, self.lon0 = header['lat0'], header['lon0']
+        self.dlat, self.dlon = header['dlat'], header['dlon']
+        self.nrows, self.ncols = self.values.shape
+        self.wraps = abs(self.ncols*self.dlon - 360) < 1.0E-9
+
+    def _grid_coords(self, phi, lamb):
+        y = (np.asarray(phi, dtype=float) - self.lat0)/self.dlat
+        x = ((np.asarray(lamb, dtype=float) - self.lon0) % 360)/self.dlon
+        return y, x
+
+    def _columns(self, col):
+        if self.wraps:
+            return col % self.ncols
+        return np.clip(col, 0, self.ncols - 1)
+
+    def undulation(self, phi, lamb, method="bilinear"):
+        """
+        Interpolates the geoid undulation at the given points
+
+        Parameters
+        ----------
+        phi : float or array_like
+            Latitude in degrees
+        lamb : float or array_like
+            Longitude in degrees
+        method : str
+            "bilinear" (4 nodes) or "bicubic" (16 nodes, cubic convolution)
+
+        Returns
+        ---------
+        float or ndarray
+            Undulation N in meters, nan outside the grid
+        """
+        if method not in METHODS:
+            raise ValueError("method must be one of {}".format(", ".join(METHODS)))
+        scalar = np.ndim(phi) == 0 and np.ndim(lamb) == 0
+        y, x = np.broadcast_arrays(*self._grid_coords(phi, lamb))
+        shape = y.shape
+        y, x = y.ravel(), x.ravel()
+        last_col = self.ncols if self.wraps else self.ncols - 1
+        inside = (y >= 0) & (y <= self.nrows - 1) & (x <= last_col)
+        N = np.full(y.shape, np.nan)
+        y, x = y[inside], x[inside]
+        row = np.clip(np.floor(y).astype(int), 0, self.nrows - 2)
+        col = np.floor(x).astype(int)
+        if not self.wraps:
+            col = np.clip(col, 0, self.ncols - 2)
+        ty, tx = y - row, x - col
+        v = self.values
+        if method == "bilinear":
+            c0, c1 = self._columns(col), self._columns(col + 1)
+            N[inside] = ((v[row, c0]*(1 - tx) + v[row, c1]*tx)*(1 - ty)
+                         + (v[row + 1, c0]*(1 - tx) + v[row + 1, c1]*tx)*ty)
+        else:
+            wy, wx = _cubic_weights(ty), _cubic_weights(tx)
+            total = np.zeros(y.shape)
+            for i, w_i in zip(range(-1, 3), wy):
+                r = np.clip(row + i, 0, self.nrows - 1)
+                for j, w_j in zip(range(-1, 3), wx):
+                    total += w_i*w_j*v[r, self._columns(col + j)]
+            N[inside] = total
+        N = N.reshape(shape)
+        return float(N) if scalar else N
+
+    def orthometric_height(self, h, phi, lamb, method="bilinear"):
+        """
+        Converts geometric (ellipsoidal) heights to orthometric heights, H = h - N
+
+        Parameters
+        ----------
+        h : float or array_like
+            Geometric altitude in meters
+        phi : float or array_like
+            Latitude in degrees
+        lamb : float or array_like
+            Longitude in degrees
+        method : str
+            Interpolation method, see undulation
+
+        Returns
+        ---------
+        float or ndarray
+            Orthometric altitude in meters
+        """
+        return h - self.undulation(phi, lamb, method)
+
+    def geometric_height(self, H, phi, lamb, method="bilinear"):
+        """
+        Converts orthometric heights to geometric (ellipsoidal) heights, h = H + N
+
+        Parameters
+        ----------
+        H : float or array_like
+            Orthometric altitude in meters
+        phi : float or array_like
+            Latitude in degrees
+        lamb : float or array_like
+            Longitude in degrees
+        method : str
+            Interpolation method, see undulation
+
+        Returns
+        ---------
+        float or ndarray
+            Geometric altitude in meters
+        """
+        return H + self.undulation(phi, lamb, method)
+
+
+@lru_cache(maxsize=None)
+def load_geoid(path):
+    """
+    Returns the GeoidGrid of a geoid model file. The model is converted into
+    the binary cache on the first use, or again when the model file is newer
+    than its cache; a path to the .npy cache itself is also accepted.
+    """
+    if path.endswith(".npy"):
+        return GeoidGrid(path)
+    values_path, header_path = _cache_paths(path)
+    if (not os.path.exists(values_path) or not os.path.exists(header_path)
+            or os.path.getmtime(values_path) < os.path.getmtime(path)):
+        convert_grid(path, values_path)
+    return GeoidGrid(values_path)
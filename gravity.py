@@ -1,28 +1,52 @@
+from collections import namedtuple
+
 import numpy as np
 from coordinate_conv import dms2degrees
+from ellipsoid import get_ellipsoid
+from instrumentation import instrumented
+
+GAMA_A = 9.8321863685  # m/s²
+GAMA_B = 9.7803267715  # m/s²
+ANG_VEL = 7292115.0E-11  # rad/s
+GM = 3986005.0E8  # m³/s²
+G = 6.67408E-11  # m³/(kg s²)
+
+# Constantes k e m de cada elipsoide, calculadas uma única vez
+_constantes = {}
+
+ReducaoGravimetrica = namedtuple('ReducaoGravimetrica', ['normal_grav', 'fac', 'bc', 'faa', 'boug_a'])
+
+
+def _k_m(elip):
+    if elip not in _constantes:
+        k = (elip.b*GAMA_A - elip.a*GAMA_B)/(elip.a*GAMA_B)
+        m = (ANG_VEL**2*elip.a**2*elip.b)/GM
+        _constantes[elip] = k, m
+    return _constantes[elip]
 
 
-def normal_gravity(phi, elip=SIRGAS2000, dms=False):
+@instrumented("normal_gravity")
+def normal_gravity(phi, elip=None, dms=False):
     """
     @parâmetros: phi - Latitude do ponto, em graus.
                  elip - Elipsoide referente aos dados. Parâmetro optativo, o padrão é o SIRGAS2000.
                  dms - Graus, minutos e segundos (bool). Parâmetro optativo, o padrão é False.
     @retorna: gama - Gravidade teórica de pontos com esta latitude de entrada, em m/s².
     """
+    if elip is None:
+        elip = get_ellipsoid("SIRGAS2000")
     if dms:
         phi = dms2degrees(phi)
     phi = np.deg2rad(phi)
     sin2_phi = np.sin(phi)**2
 
-    gama_a = 9.8321863685  # m/s²
-    gama_b = 9.7803267715  # m/s²
-
-    k = (elip.b*gama_a - elip.a*gama_b)/(elip.a*gama_b)
-    gama = gama_b*((1+k*sin2_phi)/(np.sqrt(1-elip.e1**2*sin2_phi)))
+    k, _ = _k_m(elip)
+    gama = GAMA_B*((1+k*sin2_phi)/(np.sqrt(1-elip.e1_sq*sin2_phi)))
     return gama
 
 
-def free_air_correction(phi, H, elip=SIRGAS2000, dms=False):
+@instrumented("free_air_correction")
+def free_air_correction(phi, H, elip=None, dms=False):
     """
     @parâmetros: phi - Latitude do ponto, em graus.
                  H - Altitude ortométrica do ponto, em metros.
@@ -30,11 +54,13 @@ def free_air_correction(phi, H, elip=SIRGAS2000, dms=False):
                  dms - Graus, minutos e segundos (bool). Parâmetro optativo, o padrão é False.
     @retorna: fac - Correção ar livre, em m/s².
     """
-    gama = normal_gravity(phi)  # m/s²
-    sin2_phi = np.sin(phi)**2
-    ang_vel = 7292115.0E-11  # rad/s
-    GM = 3986005.0E8  # m³/s²
-    m = (ang_vel**2*elip.a**2*elip.b)/GM
+    if elip is None:
+        elip = get_ellipsoid("SIRGAS2000")
+    if dms:
+        phi = dms2degrees(phi)
+    gama = normal_gravity(phi, elip)  # m/s²
+    sin2_phi = np.sin(np.deg2rad(phi))**2
+    _, m = _k_m(elip)
     fac = (2*gama/elip.a)*H*(1+elip.f+m-2*elip.f *
                              sin2_phi)-((3*gama*H**2)/(elip.a**2))
     # faa = faa*1.0E5 # retirar o comentário caso queira a correçao em mGal
@@ -59,7 +85,7 @@ def bouguer_correction(H, ro=2670):
     @parâmetros: H - Altitude ortométrica do ponto, em metros.
     @retorna: boug_c - Correção Bouguer, em m/s²
     """
-    boug_c = 2*np.pi*ro*6.67408E-11*H
+    boug_c = 2*np.pi*ro*G*H
     return boug_c
 
 
@@ -77,6 +103,51 @@ def bouguer_anomaly(gobs, normal_grav, fac, bc):
     return boug_a
 
 
+def complete_bouguer_anomaly(gobs, normal_grav, fac, bc, tc):
+    """
+    @parâmetros: gobs - Valor de gravidade observada, em mGal.
+                 normal_grav - Valor de gravidade teórica do elipsoide, em m/s².
+                 fac - Valor da correção ar livre do ponto, em m/s².
+                 bc - Valor da correção Bouguer do ponto, em m/s².
+                 tc - Valor da correção do terreno do ponto, em m/s² (ver terrain.terrain_correction).
+    @retorna: boug_c - Anomalia Bouguer completa, em mGal.
+    """
+    boug_c = bouguer_anomaly(gobs, normal_grav, fac, bc) + tc * 1.0E5  # tc convertida para mGal
+    return boug_c
+
+
+@instrumented("reduce_survey")
+def reduce_survey(phi, H, gobs, elip=None, ro=2670, dms=False):
+    """
+    Reduz um levantamento gravimétrico inteiro em uma única passagem vetorizada. Os termos comuns (sen²phi,
+    k e m) são calculados uma única vez, e não estação por estação.
+
+    @parâmetros: phi - Latitudes das estações, em graus.
+                 H - Altitudes ortométricas das estações, em metros.
+                 gobs - Valores de gravidade observada, em mGal.
+                 elip - Elipsoide referente aos dados. Parâmetro optativo, o padrão é o SIRGAS2000.
+                 ro - Densidade da crosta, em kg/m³. Parâmetro optativo, o padrão é 2670.
+                 dms - Graus, minutos e segundos (bool). Parâmetro optativo, o padrão é False.
+    @retorna: ReducaoGravimetrica com os campos normal_grav (m/s²), fac (m/s²), bc (m/s²), faa (mGal) e
+              boug_a (mGal), um array para cada campo.
+    """
+    if elip is None:
+        elip = get_ellipsoid("SIRGAS2000")
+    if dms:
+        phi = dms2degrees(phi)
+    H = np.asarray(H, dtype=float)
+    gobs = np.asarray(gobs, dtype=float)
+    k, m = _k_m(elip)
+
+    sin2_phi = np.sin(np.deg2rad(phi))**2
+    gama = GAMA_B*((1+k*sin2_phi)/(np.sqrt(1-elip.e1_sq*sin2_phi)))
+    fac = (2*gama/elip.a)*H*(1+elip.f+m-2*elip.f*sin2_phi)-((3*gama*H**2)/(elip.a**2))
+    bc = (2*np.pi*ro*G)*H
+    faa = (gobs/1.0E5 - gama + fac) * 1.0E5
+    boug_a = faa - bc * 1.0E5
+    return ReducaoGravimetrica(gama, fac, bc, faa, boug_a)
+
+
 def C(df, i):
     """
     @parâmetros: df - DataFrame com os dados.
@@ -90,3 +161,70 @@ def C(df, i):
         C_tmp = gp * dn
         C_f += C_tmp
     return C_f
+
+
+@instrumented("geopotential_numbers")
+def geopotential_numbers(dn, g, line_id=None, mean_gravity=False):
+    """
+    Calcula os números de geopotencial de todos os pontos em uma única soma acumulada, em vez de refazer a
+    soma desde o início da linha para cada ponto, como em C.
+
+    @parâmetros: dn - Desníveis entre o ponto anterior e cada ponto, em metros. O valor do primeiro ponto de
+                      cada linha é ignorado.
+                 g - Gravidade observada em cada ponto, em mGal.
+                 line_id - Identificador da linha de nivelamento de cada ponto. Parâmetro optativo; cada linha
+                           começa com C = 0 no seu primeiro ponto, na ordem de entrada.
+                 mean_gravity - Usa a média da gravidade entre pontos consecutivos (bool). Parâmetro optativo,
+                                o padrão é False (gravidade do ponto final do lance, como em C).
+    @retorna: C_f - Números de geopotencial dos pontos, em m²/s².
+    """
+    dn = np.asarray(dn, dtype=float)
+    g = np.asarray(g, dtype=float) / 1.0E5
+    if line_id is None:
+        order = np.arange(dn.size)
+        first = order == 0
+    else:
+        line_id = np.asarray(line_id)
+        order = np.argsort(line_id, kind='stable')
+        sorted_id = line_id[order]
+        first = np.concatenate(([True], sorted_id[1:] != sorted_id[:-1]))
+    dn, g = dn[order], g[order]
+
+    if mean_gravity:
+        gp = np.concatenate((g[:1], (g[1:] + g[:-1]) / 2))
+    else:
+        gp = g
+    C_tmp = np.where(first, 0.0, gp * dn)
+    C_acc = np.cumsum(C_tmp)
+    # Cada linha recomeça do zero: subtrai o acumulado até o início da linha
+    start = np.maximum.accumulate(np.where(first, np.arange(dn.size), 0))
+    C_sorted = C_acc - C_acc[start]
+
+    C_f = np.empty_like(C_sorted)
+    C_f[order] = C_sorted
+    return C_f
+
+
+def helmert_heights(C_f, g):
+    """
+    Calcula as altitudes ortométricas de Helmert, H = C/(g + 0.0424 H), com g em Gal e H em km, resolvendo a
+    equação do segundo grau em H.
+
+    @parâmetros: C_f - Números de geopotencial, em m²/s².
+                 g - Gravidade observada nos pontos, em mGal.
+    @retorna: H - Altitudes ortométricas de Helmert, em metros.
+    """
+    g = np.asarray(g, dtype=float) / 1.0E5
+    grad = 0.0424E-5  # gradiente de Poincaré-Prey, em (m/s²)/m
+    H = 2*C_f / (g + np.sqrt(g**2 + 4*grad*C_f))
+    return H
+
+
+def dynamic_heights(C_f, elip=None):
+    """
+    @parâmetros: C_f - Números de geopotencial, em m²/s².
+                 elip - Elipsoide de referência. Parâmetro optativo, o padrão é o SIRGAS2000.
+    @retorna: H_din - Altitudes dinâmicas, em metros (gravidade normal a 45° como referência).
+    """
+    H_din = np.asarray(C_f, dtype=float) / normal_gravity(45, elip)
+    return H_din
@@ -0,0 +1,197 @@
+import struct
+from functools import lru_cache
+
+import numpy as np
+from instrumentation import instrumented
+
+
+class SubGrid(object):
+    """
+    A subgrid of an NTv2 file. The shift records are memory-mapped, so only
+    the pages holding the cells actually used are read from disk.
+    Limits and increments are in arc seconds, with longitudes positive west,
+    as in the file.
+    """
+
+    def __init__(self, name, parent, s_lat, n_lat, e_long, w_long, lat_inc, long_inc, records):
+        self.name = name
+        self.parent = parent
+        self.s_lat, self.n_lat = s_lat, n_lat
+        self.e_long, self.w_long = e_long, w_long
+        self.lat_inc, self.long_inc = lat_inc, long_inc
+        self.nrows = int(round((n_lat - s_lat)/lat_inc)) + 1
+        self.ncols = int(round((w_long - e_long)/long_inc)) + 1
+        # (nrows, ncols, 4): latitude shift, longitude shift and their accuracies
+        self.records = records.reshape(self.nrows, self.ncols, 4)
+        self.children = []
+
+    def contains(self, lat, lon):
+        return (lat >= self.s_lat) & (lat <= self.n_lat) & (lon >= self.e_long) & (lon <= self.w_long)
+
+    def interpolate(self, lat, lon):
+        """
+        Bilinear interpolation of the latitude and longitude shifts (arc
+        seconds) at points given in arc seconds, longitudes positive west
+        """
+        y = (lat - self.s_lat)/self.lat_inc
+        x = (lon - self.e_long)/self.long_inc
+        row = np.clip(np.floor(y).astype(int), 0, self.nrows - 2)
+        col = np.clip(np.floor(x).astype(int), 0, self.ncols - 2)
+        dy, dx = (y - row)[:, None], (x - col)[:, None]
+        r = self.records
+        shift = ((r[row, col, :2]*(1 - dx) + r[row, col + 1, :2]*dx)*(1 - dy)
+                 + (r[row + 1, col, :2]*(1 - dx) + r[row + 1, col + 1, :2]*dx)*dy)
+        return shift[:, 0], shift[:, 1]
+
+
+class NTv2Grid(object):
+    """
+    A class used to apply the datum shifts of an NTv2 grid file. Only the
+    headers are read on initialization; the shift records are memory-mapped.
+    Each point is located by descending the subgrid tree (it is only tested
+    against the children of the subgrid it already fell in), and the shifts
+    of all the points of a subgrid are interpolated in one vectorized call.
+    For initialization, it requires:
+    path -> path of the .gsb file
+    """
+
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        path : str
+            Path of the NTv2 (.gsb) file
+        ---------
+        """
+        self.path = path
+        with open(path, "rb") as infile:
+            header = infile.read(11*16)
+        # NUM_OREC is 11 in every file, which tells the byte order
+        self.endian = "<" if struct.unpack("<i", header[8:12])[0] == 11 else ">"
+        n_orec = self._int(header, 0)
+        n_file = self._int(header, 2)
+        self.gs_type = header[3*16 + 8:3*16 + 16].decode("ascii").strip()
+        self.system_from = header[5*16 + 8:5*16 + 16].decode("ascii").strip()
+        self.system_to = header[6*16 + 8:6*16 + 16].decode("ascii").strip()
+        if self.gs_type != "SECONDS":
+            raise ValueError("only grids in SECONDS are supported, not {}".format(self.gs_type))
+
+        self.subgrids = {}
+        offset = n_orec*16
+        with open(path, "rb") as infile:
+            for _ in range(n_file):
+                infile.seek(offset)
+                sub = infile.read(11*16)
+                name = sub[8:16].decode("ascii").strip()
+                parent = sub[16 + 8:32].decode("ascii").strip()
+                values = [struct.unpack(self.endian + "d", sub[16*k + 8:16*k + 16])[0] for k in range(4, 10)]
+                count = self._int(sub, 10)
+                records = np.memmap(path, dtype=self.endian + "f4", mode="r", offset=offset + 11*16,
+                                    shape=(count*4,))
+                self.subgrids[name] = SubGrid(name, parent, *values, records)
+                offset += (11 + count)*16
+
+        self.roots = []
+        for grid in self.subgrids.values():
+            if grid.parent in self.subgrids:
+                self.subgrids[grid.parent].children.append(grid)
+            else:
+                self.roots.append(grid)
+
+    def _int(self, block, record):
+        return struct.unpack(self.endian + "i", block[16*record + 8:16*record + 12])[0]
+
+    def _locate(self, lat, lon):
+        """
+        Finest subgrid holding each point, as an index into the returned list
+        of subgrids, -1 outside the grid
+        """
+        order = []
+        found = np.full(lat.shape, -1)
+        pending = [(grid, np.arange(lat.size)) for grid in self.roots]
+        while pending:
+            grid, idx = pending.pop()
+            inside = idx[grid.contains(lat[idx], lon[idx])]
+            if inside.size == 0:
+                continue
+            found[inside] = len(order)
+            order.append(grid)
+            pending.extend((child, inside) for child in grid.children)
+        return found, order
+
+    def shifts(self, phi, lamb):
+        """
+        Interpolated shifts at the given points
+
+        Parameters
+        ----------
+        phi : array_like
+            Latitudes in degrees
+        lamb : array_like
+            Longitudes in degrees
+
+        Returns
+        ---------
+        ndarray
+            Latitude shifts in degrees (nan outside the grid)
+        ndarray
+            Longitude shifts in degrees, positive east (nan outside the grid)
+        """
+        phi, lamb = np.broadcast_arrays(np.asarray(phi, dtype=float), np.asarray(lamb, dtype=float))
+        shape = phi.shape
+        lat, lon = phi.ravel()*3600, -lamb.ravel()*3600
+        found, order = self._locate(lat, lon)
+        dlat, dlon = np.full(lat.shape, np.nan), np.full(lat.shape, np.nan)
+        for k, grid in enumerate(order):
+            idx = np.nonzero(found == k)[0]
+            if idx.size:
+                dlat[idx], dlon[idx] = grid.interpolate(lat[idx], lon[idx])
+        return (dlat/3600).reshape(shape), (-dlon/3600).reshape(shape)
+
+    @instrumented("NTv2Grid.transform", size_arg=1)
+    def transform(self, phi, lamb, inverse=False, tol=1.0E-12, max_iter=10):
+        """
+        Transforms coordinates from the source to the target system of the
+        grid or, with inverse=True, from the target back to the source (by
+        fixed-point iteration). Points outside the grid come back as nan.
+
+        Parameters
+        ----------
+        phi : array_like
+            Latitudes in degrees
+        lamb : array_like
+            Longitudes in degrees
+        inverse : bool
+            Whether to apply the inverse transformation
+
+        Returns
+        ---------
+        ndarray
+            Transformed latitudes in degrees
+        ndarray
+            Transformed longitudes in degrees
+        """
+        phi = np.asarray(phi, dtype=float)
+        lamb = np.asarray(lamb, dtype=float)
+        dlat, dlon = self.shifts(phi, lamb)
+        if not inverse:
+            return phi + dlat, lamb + dlon
+        phi_s, lamb_s = phi - dlat, lamb - dlon
+        for _ in range(max_iter):
+            dlat, dlon = self.shifts(phi_s, lamb_s)
+            phi_new, lamb_new = phi - dlat, lamb - dlon
+            delta = np.nanmax(np.abs(np.concatenate((np.ravel(phi_new - phi_s), np.ravel(lamb_new - lamb_s)))),
+                              initial=0)
+            phi_s, lamb_s = phi_new, lamb_new
+            if delta < tol:
+                break
+        return phi_s, lamb_s
+
+
+@lru_cache(maxsize=None)
+def load_grid(path):
+    """
+    Returns the NTv2Grid of the given file, reading its headers only on the
+    first request
+    """
+    return NTv2Grid(path)
@@ -0,0 +1,219 @@
+"""
+Opt-in instrumentation of the geodesic, datum and gravity functions.
+
+While disabled (the default) an instrumented function only pays for one flag
+check. Once enabled with enable(), every call records its wall time and
+batch size, and the Vincenty solvers also record the iteration count of each
+pair and how many pairs did not converge. The data is aggregated in
+histograms, available from stats() or as Prometheus text from
+prometheus_text().
+"""
+import functools
+import threading
+import time
+
+import numpy as np
+
+SECONDS_BUCKETS = (1.0E-6, 1.0E-5, 1.0E-4, 1.0E-3, 1.0E-2, 0.1, 1.0, 10.0)
+SIZE_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000, 10000000)
+ITERATION_BUCKETS = (1, 2, 3, 4, 5, 10, 20, 50, 100, 500, 1000, 2000)
+
+_enabled = False
+_lock = threading.Lock()
+_metrics = {}
+
+
+class Histogram(object):
+    """
+    A histogram with fixed upper bounds, plus the sum and count of the
+    observed values
+    """
+
+    def __init__(self, bounds):
+        self.bounds = np.asarray(bounds, dtype=float)
+        self.counts = np.zeros(len(bounds) + 1, dtype=np.int64)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, values):
+        values = np.atleast_1d(np.asarray(values, dtype=float)).ravel()
+        self.counts += np.bincount(np.searchsorted(self.bounds, values), minlength=self.counts.size)
+        self.sum += float(values.sum())
+        self.count += values.size
+
+    def merge(self, other):
+        """
+        Adds the observations of another histogram with the same bounds
+        """
+        self.counts += other.counts
+        self.sum += other.sum
+        self.count += other.count
+
+    def as_dict(self):
+        return {'bounds': self.bounds.tolist(), 'counts': self.counts.tolist(), 'sum': self.sum,
+                'count': self.count}
+
+
+def _metric(name):
+    if name not in _metrics:
+        _metrics[name] = {'calls': 0, 'nonconverged': 0, 'seconds': Histogram(SECONDS_BUCKETS),
+                          'batch_size': Histogram(SIZE_BUCKETS), 'iterations': Histogram(ITERATION_BUCKETS)}
+    return _metrics[name]
+
+
+def enable():
+    """
+    Starts recording
+    """
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """
+    Stops recording. The data recorded so far is kept
+    """
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """
+    Discards the data recorded so far
+    """
+    with _lock:
+        _metrics.clear()
+
+
+def collect():
+    """
+    Returns the raw data recorded so far and discards it, so another process
+    can add it to its own with merge()
+    """
+    with _lock:
+        metrics = dict(_metrics)
+        _metrics.clear()
+    return metrics
+
+
+def merge(metrics):
+    """
+    Adds raw data returned by collect() in another process to the data
+    recorded here
+    """
+    with _lock:
+        for name, other in metrics.items():
+            metric = _metric(name)
+            metric['calls'] += other['calls']
+            metric['nonconverged'] += other['nonconverged']
+            for key in ('seconds', 'batch_size', 'iterations'):
+                metric[key].merge(other[key])
+
+
+def record_call(name, seconds, size):
+    """
+    Records one call of the function name, which took seconds and processed
+    size points
+    """
+    with _lock:
+        metric = _metric(name)
+        metric['calls'] += 1
+        metric['seconds'].observe(seconds)
+        metric['batch_size'].observe(size)
+
+
+def record_iterations(name, iterations, converged=None):
+    """
+    Records the iteration counts of an iterative solver, one per point, and
+    the number of points that did not converge
+    """
+    with _lock:
+        metric = _metric(name)
+        if iterations is not None:
+            metric['iterations'].observe(iterations)
+        if converged is not None:
+            metric['nonconverged'] += int(np.size(converged) - np.count_nonzero(converged))
+
+
+def _batch_size(args):
+    """
+    Number of points of a call: the broadcast size of its array and number
+    arguments, or the size of the first one if they do not broadcast
+    """
+    arrays = [a for a in args if isinstance(a, (np.ndarray, list, tuple)) or np.isscalar(a)]
+    arrays = [a for a in arrays if not isinstance(a, (str, bytes))]
+    if not arrays:
+        return 1
+    try:
+        return np.broadcast(*arrays[:32]).size
+    except ValueError:
+        return np.size(arrays[0])
+
+
+def instrumented(name, size_arg=0):
+    """
+    Decorator that records the wall time and the batch size (the broadcast
+    size of the positional arguments from size_arg on, 1 for methods) of each
+    call while the instrumentation is enabled
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            record_call(name, time.perf_counter() - start, _batch_size(args[size_arg:]))
+            return result
+        return wrapper
+    return decorator
+
+
+def stats():
+    """
+    Returns the recorded data as a dictionary keyed by function name
+    """
+    with _lock:
+        return {name: {'calls': m['calls'], 'nonconverged': m['nonconverged'],
+                       'seconds': m['seconds'].as_dict(), 'batch_size': m['batch_size'].as_dict(),
+                       'iterations': m['iterations'].as_dict()}
+                for name, m in _metrics.items()}
+
+
+def _format_bound(value):
+    return "{:g}".format(value)
+
+
+def prometheus_text(prefix="geodesy"):
+    """
+    Returns the recorded data in the Prometheus text exposition format
+    """
+    lines = []
+    data = stats()
+    for metric, kind, help_text in (('calls_total', 'counter', 'Number of calls'),
+                                    ('nonconverged_total', 'counter', 'Points that did not converge')):
+        lines.append("# HELP {}_{} {}".format(prefix, metric, help_text))
+        lines.append("# TYPE {}_{} {}".format(prefix, metric, kind))
+        key = 'calls' if metric == 'calls_total' else 'nonconverged'
+        for name, m in sorted(data.items()):
+            lines.append('{}_{}{{function="{}"}} {}'.format(prefix, metric, name, m[key]))
+    for metric, key, help_text in (('call_seconds', 'seconds', 'Wall time per call'),
+                                   ('batch_size', 'batch_size', 'Points per call'),
+                                   ('iterations', 'iterations', 'Iterations per point')):
+        lines.append("# HELP {}_{} {}".format(prefix, metric, help_text))
+        lines.append("# TYPE {}_{} histogram".format(prefix, metric))
+        for name, m in sorted(data.items()):
+            hist = m[key]
+            if not hist['count']:
+                continue
+            cumulative = np.cumsum(hist['counts'])
+            for bound, count in zip(hist['bounds'] + [float('inf')], cumulative):
+                le = "+Inf" if bound == float('inf') else _format_bound(bound)
+                lines.append('{}_{}_bucket{{function="{}",le="{}"}} {}'.format(prefix, metric, name, le, count))
+            lines.append('{}_{}_sum{{function="{}"}} {}'.format(prefix, metric, name, repr(hist['sum'])))
+            lines.append('{}_{}_count{{function="{}"}} {}'.format(prefix, metric, name, hist['count']))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,131 @@
+"""
+Load generator for service.py.
+
+Opens a number of concurrent keep-alive connections, each one sending
+requests of a few points back to back for a fixed time, and reports the
+throughput and the latency percentiles. Several concurrency levels can be
+given to trace latency against throughput:
+
+    python service.py -j 4 &
+    python loadgen.py --operation inverse_problem --points 4 --concurrency 1 8 64 256
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import numpy as np
+
+SEED = 20200101
+
+
+def make_payload(operation, points, seed=SEED):
+    """
+    Request body of an operation with the given number of points, always
+    the same for the same seed
+    """
+    rng = np.random.default_rng(seed)
+    lat = lambda: rng.uniform(-60, 60, points).tolist()
+    lon = lambda: rng.uniform(-180, 180, points).tolist()
+    if operation == 'inverse_problem':
+        payload = {'phi1': lat(), 'lamb1': lon(), 'phi2': lat(), 'lamb2': lon()}
+    elif operation == 'problema_direto':
+        payload = {'phi1': lat(), 'lamb1': lon(), 'alpha1': rng.uniform(0, 360, points).tolist(),
+                   's': rng.uniform(0, 1.0E7, points).tolist()}
+    elif operation == 'cart2geod':
+        payload = {'X': [4010000.0]*points, 'Y': [-4250000.0]*points, 'Z': rng.uniform(-2.6E6, -2.4E6, points).tolist()}
+    else:
+        payload = {'lamb': lon(), 'phi': lat(), 'h': rng.uniform(0, 1000, points).tolist()}
+        if operation == 'conv_geod_datum':
+            payload.update(ellipsoid='SIRGAS2000', target='SAD69')
+    return json.dumps(payload).encode()
+
+
+async def _connect(host, port, unix):
+    if unix is not None:
+        return await asyncio.open_unix_connection(unix)
+    return await asyncio.open_connection(host, port)
+
+
+async def _client(host, port, unix, request, deadline, latencies, errors):
+    reader, writer = await _connect(host, port, unix)
+    try:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                header = await reader.readline()
+                if header in (b'\r\n', b''):
+                    break
+                field, _, value = header.decode('latin-1').partition(':')
+                if field.strip().lower() == 'content-length':
+                    length = int(value)
+            await reader.readexactly(length)
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def run_level(operation, points, concurrency, duration, host="127.0.0.1", port=8765, unix=None):
+    """
+    Runs concurrency clients for duration seconds
+
+    Returns
+    --------
+    dict
+        Requests and points per second and the p50, p99 and maximum latency in
+        seconds
+    """
+    body = make_payload(operation, points)
+    request = ("POST /{} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+               "Content-Length: {}\r\n\r\n".format(operation, len(body))).encode() + body
+    latencies, errors = [], []
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(_client(host, port, unix, request, deadline, latencies, errors)
+                           for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    lat = np.array(latencies) if latencies else np.array([np.nan])
+    return {'operation': operation, 'points': points, 'concurrency': concurrency, 'requests': len(latencies),
+            'errors': len(errors), 'requests_per_second': len(latencies)/elapsed,
+            'points_per_second': len(latencies)*points/elapsed, 'p50': float(np.percentile(lat, 50)),
+            'p99': float(np.percentile(lat, 99)), 'max': float(lat.max())}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measures latency against throughput of service.py")
+    parser.add_argument("--host", default="127.0.0.1", help="address of the service")
+    parser.add_argument("--port", type=int, default=8765, help="TCP port of the service")
+    parser.add_argument("--unix", help="Unix socket of the service instead of TCP")
+    parser.add_argument("--operation", default="inverse_problem", help="operation requested")
+    parser.add_argument("--points", type=int, default=1, help="points per request")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 64], help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per concurrency level")
+    parser.add_argument("-o", "--output", help="JSON file for the results")
+    args = parser.parse_args(argv)
+
+    results = []
+    print("{:>11} {:>10} {:>12} {:>10} {:>10} {:>7}".format('concurrency', 'req/s', 'points/s', 'p50 ms',
+                                                               'p99 ms', 'errors'))
+    for concurrency in args.concurrency:
+        result = asyncio.run(run_level(args.operation, args.points, concurrency, args.duration,
+                                       args.host, args.port, args.unix))
+        results.append(result)
+        print("{:>11} {:>10.0f} {:>12.0f} {:>10.2f} {:>10.2f} {:>7}".format(
+            concurrency, result['requests_per_second'], result['points_per_second'], result['p50']*1000,
+            result['p99']*1000, result['errors']))
+    if args.output:
+        with open(args.output, "w") as outfile:
+            json.dump(results, outfile, indent=1)
+    return 1 if any(r['errors'] for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,35 @@
-from ellipsoid import export_ellipsoids
+import argparse
 
-##### NOT IMPLEMENTED #########
+from batch_pipeline import OPERATIONS, run
+from ellipsoid import get_ellipsoid
 
-ellipsoid_dict = export_ellipsoids()
 
-print(ellipsoid_dict["WGS84"].grandeNormal(55))
+def main(argv=None):
+    """
+    Command line entry point. Streams a CSV or Parquet file through a chain
+    of conversions, e.g.:
+
+    python main.py survey.csv out.csv -o conv_geod_datum geod2cart --ellipsoid SAD69 --to SIRGAS2000
+    """
+    parser = argparse.ArgumentParser(description="Applies a chain of geodetic conversions to a CSV or Parquet file")
+    parser.add_argument("input", help="input file (.csv, .parquet or .pq)")
+    parser.add_argument("output", help="output file (.csv, .parquet or .pq)")
+    parser.add_argument("-o", "--operations", nargs="+", required=True, choices=list(OPERATIONS),
+                        help="operations applied to every chunk, in order")
+    parser.add_argument("--ellipsoid", default="SIRGAS2000", help="datum of the input coordinates")
+    parser.add_argument("--to", help="target datum of conv_geod_datum")
+    parser.add_argument("--lat", default="lat", help="latitude column (degrees)")
+    parser.add_argument("--lon", default="lon", help="longitude column (degrees)")
+    parser.add_argument("--height", default="h", help="geometric altitude column (meters)")
+    parser.add_argument("--chunk-size", type=int, default=100000, help="rows per chunk")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="number of worker processes")
+    args = parser.parse_args(argv)
+
+    ctx = {'elip': get_ellipsoid(args.ellipsoid), 'target': get_ellipsoid(args.to) if args.to else None,
+           'lat': args.lat, 'lon': args.lon, 'h': args.height}
+    rows = run(args.input, args.output, args.operations, ctx, chunk_size=args.chunk_size, jobs=args.jobs)
+    print("{} rows written to {}".format(rows, args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,103 @@
+from functools import lru_cache
+
 import numpy as np
+from coordinate_conv import geod2cart
+
+
+class LocalFrame(object):
+    """
+    LocalFrame(lamb0, phi0, origin=None)
+
+    Sistema geodésico local (topocêntrico) de um ponto datum. A matriz de rotação e a sua transposta são
+    calculadas uma única vez, e cada transformação é um único produto matricial sobre arrays (N, 3).
+
+    Parâmetros
+    --------------
+    lamb0: Longitude geodésica do ponto datum.
+    phi0: Latitude geodésica do ponto datum.
+    origin: Coordenadas cartesianas (X, Y, Z) do ponto datum. Optativo, necessário apenas para converter
+    coordenadas absolutas.
+    """
+
+    def __init__(self, lamb0, phi0, origin=None):
+        self.lamb0 = lamb0
+        self.phi0 = phi0
+        self.origin = None if origin is None else np.asarray(origin, dtype=float)
+        lamb0 = np.deg2rad(lamb0)
+        phi0 = np.deg2rad(phi0)
+        sin_l, cos_l = np.sin(lamb0), np.cos(lamb0)
+        sin_p, cos_p = np.sin(phi0), np.cos(phi0)
+        self.R = np.array([[-sin_l, cos_l, 0],
+                           [-sin_p*cos_l, -sin_p*sin_l, cos_p],
+                           [cos_p*cos_l, cos_p*sin_l, sin_p]])
+        self.RT = np.ascontiguousarray(self.R.T)
+
+    def to_enu(self, dxyz):
+        """
+        Passa variações de coordenadas cartesianas, array (N, 3), para coordenadas topocêntricas (e, n, u).
+        """
+        return np.asarray(dxyz, dtype=float) @ self.RT
+
+    def from_enu(self, enu):
+        """
+        Passa coordenadas topocêntricas (e, n, u), array (N, 3), para variações de coordenadas cartesianas.
+        """
+        return np.asarray(enu, dtype=float) @ self.R
+
+    def cart2enu(self, xyz):
+        """
+        Passa coordenadas cartesianas absolutas, array (N, 3), para coordenadas topocêntricas em relação à
+        origem do sistema.
+        """
+        self._check_origin()
+        return (np.asarray(xyz, dtype=float) - self.origin) @ self.RT
+
+    def enu2cart(self, enu):
+        """
+        Passa coordenadas topocêntricas, array (N, 3), para coordenadas cartesianas absolutas.
+        """
+        self._check_origin()
+        return np.asarray(enu, dtype=float) @ self.R + self.origin
+
+    def geod2enu(self, lamb, phi, h, elip):
+        """
+        Passa coordenadas geodésicas (arrays de longitudes, latitudes e altitudes geométricas) diretamente para
+        coordenadas topocêntricas, array (N, 3), em relação à origem do sistema.
+        """
+        return self.cart2enu(np.stack(np.broadcast_arrays(*geod2cart(lamb, phi, h, elip)), axis=-1))
+
+    def _check_origin(self):
+        if self.origin is None:
+            raise ValueError("this LocalFrame has no origin; use local_frame(lamb0, phi0, origin=(X0, Y0, Z0)) "
+                             "or local_frame(lamb0, phi0, elip=elip, h0=h0)")
+
+
+@lru_cache(maxsize=256)
+def _cached_frame(lamb0, phi0, origin):
+    return LocalFrame(lamb0, phi0, origin)
+
+
+def local_frame(lamb0, phi0, origin=None, elip=None, h0=0.0):
+    """
+    local_frame(lamb0, phi0, origin=None, elip=None, h0=0.0)
+
+    Retorna o LocalFrame do ponto datum, reaproveitando o mesmo objeto para os mesmos parâmetros.
+
+    Parâmetros
+    --------------
+    lamb0: Longitude geodésica do ponto datum.
+    phi0: Latitude geodésica do ponto datum.
+    origin: Coordenadas cartesianas (X0, Y0, Z0) do ponto datum. Optativo; não pode ser informado junto com elip.
+    elip: Instância da classe Ellipsoid, usada para calcular a origem a partir de (lamb0, phi0, h0). Optativo.
+    h0: Altitude geométrica do ponto datum, usada apenas com elip.
+    """
+    if elip is not None:
+        if origin is not None:
+            raise ValueError("origin and elip are mutually exclusive; pass the height of the datum point as h0")
+        origin = tuple(float(c) for c in geod2cart(lamb0, phi0, float(h0), elip))
+    elif origin is not None:
+        origin = tuple(float(c) for c in origin)
+    return _cached_frame(float(lamb0), float(phi0), origin)
 
 
 def astrloc2geodloc(X0, Y0, Z0, Xp, Yp, Zp, lamb0, phi0):
@@ -25,15 +124,10 @@ def astrloc2geodloc(X0, Y0, Z0, Xp, Yp, Zp, lamb0, phi0):
     np_: Coordenada topocêntrica norte do ponto considerado.
     up: Coordenada topocêntrica vertical do ponto considerado.
     """
-    lamb0 = np.deg2rad(lamb0)
-    phi0 = np.deg2rad(phi0)
-    v_astrloc = np.array([[Xp-X0], [Yp-Y0], [Zp-Z0]])
-    matriz_transf = np.array([[-np.sin(lamb0), np.cos(lamb0), 0],
-                              [-np.sin(phi0)*np.cos(lamb0), -np.sin(phi0)
-                               * np.sin(lamb0), np.cos(phi0)],
-                              [np.cos(phi0)*np.cos(lamb0), np.cos(phi0)*np.sin(lamb0), np.sin(phi0)]])
-    ep, np_, up = np.matmul(matriz_transf, v_astrloc)
-    return ep[0], np_[0], up[0]
+    v_astrloc = np.stack(np.broadcast_arrays(np.subtract(Xp, X0), np.subtract(Yp, Y0), np.subtract(Zp, Z0)),
+                         axis=-1)
+    enu = local_frame(lamb0, phi0).to_enu(v_astrloc)
+    return enu[..., 0][()], enu[..., 1][()], enu[..., 2][()]
 
 
 def geodloc2astrloc(e, n, u, lamb0, phi0):
@@ -57,12 +151,6 @@ def geodloc2astrloc(e, n, u, lamb0, phi0):
     dy: Variação da coordenada topográfica Y.
     dz: Variação da coordenada topográfica Z.
     """
-    lamb0 = np.deg2rad(lamb0)
-    phi0 = np.deg2rad(phi0)
-    v_geodloc = np.array([[e], [n], [u]])
-    matriz_transf = np.array([[-np.sin(lamb0), -np.sin(phi0)*np.cos(lamb0), np.cos(phi0)*np.cos(lamb0)],
-                              [np.cos(lamb0), -np.sin(phi0)*np.sin(lamb0),
-                               np.cos(phi0)*np.sin(lamb0)],
-                              [0, np.cos(phi0), np.sin(phi0)]])
-    dx, dy, dz = np.matmul(matriz_transf, v_geodloc)
-    return dx[0], dy[0], dz[0]
+    v_geodloc = np.stack(np.broadcast_arrays(e, n, u), axis=-1)
+    dxyz = local_frame(lamb0, phi0).from_enu(v_geodloc)
+    return dxyz[..., 0][()], dxyz[..., 1][()], dxyz[..., 2][()]
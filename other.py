@@ -1,6 +1,10 @@
+from collections import namedtuple
+
 import numpy as np
 from coordinate_conv import dms2degrees
 
+ReducaoDistancia = namedtuple('ReducaoDistancia', ['DGC', 'DGA', 'DEC', 'DEA'])
+
 
 def calc_comp_desvio(lamb_g, phi_g, lamb_a, phi_a, dms=False):
     """
@@ -52,7 +56,7 @@ class reducoes_simplificadas(object):
         self.HB = HB
         self.R = R
 
-        self.DGC = (self.DH/self.R)*(self.R-(np.mean(np.abs(self.HA-self.HB))))
+        self.DGC = (self.DH/self.R)*(self.R-np.abs(self.HA-self.HB))
         self.DGA = self.DGC * (1+(self.DGC**2/(24*self.R**2)))
         self.DEC = self.DGC + (1.027*self.DGC**3*1.0E-15)
         self.DEA = self.DEC*(1+(self.DEC**2/(24*self.R**2)))
@@ -78,9 +82,63 @@ class reducoes(object):
         self.HB = HB
         self.R = R
 
-        self.DEC = np.sqrt((self.DI**2-(self.hA-self.hB)**2) /
-                           ((1+(self.hA/self.R))*(1+(self.hB/self.R))))
-        self.DEA = self.DEC * (1+(self.DEC**2/(24*self.R**2)))
-        self.DGC = np.sqrt((self.DI**2-(self.HA-self.HB)**2) /
-                           ((1+(self.HA/self.R))*(1+(self.HB/self.R))))
-        self.DGA = self.DGC * (1+(self.DGC**2/(24*self.R**2)))
+        self.DGC, self.DGA, self.DEC, self.DEA = reduz_distancias(DI, hA, hB, HA, HB, R)
+
+
+def raio_local(elip, phi, azimute=None):
+    """
+    raio_local(elip, phi, azimute=None)
+
+    Raio de curvatura local do elipsoide: o raio médio de Gauss, sqrt(MN), ou, dado o azimute da linha, o raio
+    da seção normal nesse azimute (fórmula de Euler).
+
+    Parâmetros
+    ------------
+    elip: Instância da classe Ellipsoid.
+    phi: Latitude em graus (escalar ou array).
+    azimute: Azimute da linha em graus (escalar ou array), opcional.
+
+    Retorna
+    --------------
+    R: Raio de curvatura em metros.
+    """
+    if azimute is None:
+        return elip.meanRadius(phi)
+    return elip.azimuthRadius(phi, azimute)
+
+
+def reduz_distancias(DI, hA, hB, HA, HB, R=6371000.0, elip=None, phi=None, azimute=None):
+    """
+    reduz_distancias(DI, hA, hB, HA, HB, R=6371000.0, elip=None, phi=None, azimute=None)
+
+    Reduz ao geoide e ao elipsoide, em uma única passagem vetorizada, as distâncias inclinadas de um
+    levantamento inteiro. Cada argumento pode ser um escalar ou uma coluna (array) com uma entrada por
+    medição.
+
+    Parâmetros
+    ------------
+    DI: Distâncias inclinadas em metros.
+    hA, hB: Altitudes geométricas dos extremos em metros.
+    HA, HB: Altitudes ortométricas dos extremos em metros.
+    R: Raio médio terrestre em metros, usado quando elip não é dado.
+    elip: Instância da classe Ellipsoid. Se dada, usa o raio de curvatura local (ver raio_local) no lugar de R.
+    phi: Latitude das medições em graus, obrigatória com elip.
+    azimute: Azimute das linhas em graus, opcional com elip.
+
+    Retorna
+    --------------
+    ReducaoDistancia com as colunas:
+    DGC: Distância no geoide em corda.
+    DGA: Distância no geoide em arco.
+    DEC: Distância no elipsoide em corda.
+    DEA: Distância no elipsoide em arco.
+    """
+    if elip is not None:
+        if phi is None:
+            raise ValueError("phi é obrigatório para usar o raio de curvatura do elipsoide")
+        R = raio_local(elip, phi, azimute)
+    DI2 = np.square(DI)
+    DEC = np.sqrt((DI2-np.square(np.subtract(hA, hB))) / ((1+np.divide(hA, R))*(1+np.divide(hB, R))))
+    DGC = np.sqrt((DI2-np.square(np.subtract(HA, HB))) / ((1+np.divide(HA, R))*(1+np.divide(HB, R))))
+    R2 = 24*np.square(R)
+    return ReducaoDistancia(DGC, DGC*(1+DGC**2/R2), DEC, DEC*(1+DEC**2/R2))
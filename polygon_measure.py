@@ -0,0 +1,191 @@
+import numpy as np
+from vincenty_dist_formulae import inverse_problem_batch
+
+# Edges up to this length (meters) take their area from the authalic sphere,
+# where the great circle and the geodesic differ by less than the rounding of
+# the ellipsoidal formula: its term c²*(alpha2-alpha1) multiplies the
+# azimuths, which are ill-conditioned on short lines, by about 4E13 m²
+SHORT_EDGE = 5000.0
+# Gauss-Legendre nodes for the integral I4 of the ellipsoidal area term
+_NODES, _WEIGHTS = np.polynomial.legendre.leggauss(16)
+
+
+def _ring_ids(n, offsets):
+    """
+    Ring (or line) index of each vertex, given the offsets of the rings
+    """
+    if offsets is None:
+        return np.zeros(n, dtype=int), 1
+    offsets = np.asarray(offsets, dtype=int)
+    if offsets[0] != 0 or offsets[-1] != n or np.any(np.diff(offsets) < 0):
+        raise ValueError("offsets must start at 0, end at the number of vertices and never decrease")
+    return np.repeat(np.arange(offsets.size - 1), np.diff(offsets)), offsets.size - 1
+
+
+def _authalic(phi, elip):
+    """
+    Authalic latitude (radians) of the geodetic latitudes phi (degrees) and
+    the radius of the sphere with the same area as the ellipsoid
+    """
+    e = elip.e1
+    sin_phi = np.sin(np.deg2rad(phi))
+
+    def q(s):
+        return (1 - elip.e1_sq)*(s/(1 - elip.e1_sq*s**2) + np.arctanh(e*s)/e)
+
+    qp = q(1.0)
+    return np.arcsin(np.clip(q(sin_phi)/qp, -1, 1)), elip.a*np.sqrt(qp/2)
+
+
+def _t(x):
+    """
+    t(x) = x + sqrt(1/x + 1)*asinh(sqrt(x)) of Karney (2013), eq. 60
+    """
+    sx = np.sqrt(x)
+    g = np.where(x > 0, np.arcsinh(sx)/np.where(x > 0, sx, 1), 1.0)
+    return x + np.sqrt(1 + x)*g
+
+
+def _dt(x):
+    """
+    Derivative of _t, for x > 0
+    """
+    sx = np.sqrt(x)
+    g = np.arcsinh(sx)/sx
+    return 1 + g/(2*np.sqrt(1 + x)) + (1 - np.sqrt(1 + x)*g)/(2*x)
+
+
+def _geodesic_area(phi1, phi2, alpha1, alpha2, elip, c2):
+    """
+    Area S12 (m²) between the geodesics and the equator, from the latitudes
+    of their ends and their forward azimuths at both ends (degrees), as
+    S12 = c²*(alpha2 - alpha1) + e²*a²*cos(alpha0)*sin(alpha0)*(I4(sigma2) - I4(sigma1))
+    (Karney, 2013, eq. 58-59), with I4 integrated by Gauss-Legendre
+    quadrature over the auxiliary sphere
+    """
+    alp1, alp2 = np.deg2rad(alpha1), np.deg2rad(alpha2)
+    beta1 = np.arctan((1 - elip.f)*np.tan(np.deg2rad(phi1)))
+    beta2 = np.arctan((1 - elip.f)*np.tan(np.deg2rad(phi2)))
+    sin_alp0 = np.sin(alp1)*np.cos(beta1)
+    cos_alp0 = np.hypot(np.cos(alp1), np.sin(alp1)*np.sin(beta1))
+    sigma1 = np.arctan2(np.sin(beta1), np.cos(alp1)*np.cos(beta1))
+    sigma2 = np.arctan2(np.sin(beta2), np.cos(alp2)*np.cos(beta2))
+    sigma12 = np.mod(sigma2 - sigma1, 2*np.pi)
+
+    ep2 = elip.e2_sq
+    sigma = sigma1[:, None] + sigma12[:, None]*(_NODES + 1)/2
+    x = (ep2*cos_alp0**2)[:, None]*np.sin(sigma)**2
+    d = ep2 - x
+    # Near the vertex of a meridian-like geodesic the divided difference
+    # cancels, and the derivative at the midpoint replaces it
+    close = d < 1.0E-4*ep2
+    q = np.where(close, _dt((x + ep2)/2), (_t(ep2) - _t(x))/np.where(close, 1, d))
+    I4 = -(q*np.sin(sigma)/2) @ _WEIGHTS*sigma12/2
+
+    alp12 = np.mod(alp2 - alp1 + np.pi, 2*np.pi) - np.pi
+    return c2*alp12 + elip.e1_sq*elip.a**2*cos_alp0*sin_alp0*I4
+
+
+def polyline_length(phi, lamb, elip, offsets=None):
+    """
+    Calculates the ellipsoidal length of one or many polylines. All the
+    segments are solved by a single call to inverse_problem_batch.
+
+    Parameters
+    -----------
+    phi: array_like
+        Latitudes of the vertices in degrees
+    lamb: array_like
+        Longitudes of the vertices in degrees
+    elip: object
+        Instance of the Ellipsoid class
+    offsets: array_like
+        Optional offsets of the lines: the vertices of line i are
+        offsets[i]:offsets[i+1]. If omitted, all vertices form one line
+
+    Returns
+    --------
+    float or ndarray
+        Length of each line in meters
+    """
+    phi = np.asarray(phi, dtype=float).ravel()
+    lamb = np.asarray(lamb, dtype=float).ravel()
+    ring, n_rings = _ring_ids(phi.size, offsets)
+    same = ring[:-1] == ring[1:]
+    s, _, _, _ = inverse_problem_batch(phi[:-1][same], lamb[:-1][same], phi[1:][same], lamb[1:][same], elip)
+    length = np.bincount(ring[:-1][same], weights=s, minlength=n_rings)
+    return length if offsets is not None else float(length[0])
+
+
+def polygon_area_perimeter(phi, lamb, elip, offsets=None):
+    """
+    Calculates the area and the perimeter of one or many polygons on the
+    ellipsoid. The rings may be given closed (last vertex equal to the first)
+    or open.
+
+    The perimeter is the sum of the Vincenty distances of the edges, solved by
+    a single call to inverse_problem_batch. The area is the sum of the areas
+    between each edge and the equator. Edges longer than SHORT_EDGE take the
+    ellipsoidal formula of Karney (2013) from the Vincenty azimuths; shorter
+    ones the spherical excess on the authalic sphere (the sphere with the
+    same area as the ellipsoid, with the vertices at their authalic
+    latitudes), whose great circles are within rounding of the geodesics at
+    that length. Against geographiclib the error is about 1E-11 of the area,
+    and not less than about one square meter, the rounding of the areas
+    between the edges and the equator. Rings may contain a pole; a ring enclosing more
+    than half of the ellipsoid gets the area of the rest of it.
+
+    Parameters
+    -----------
+    phi: array_like
+        Latitudes of the vertices in degrees
+    lamb: array_like
+        Longitudes of the vertices in degrees
+    elip: object
+        Instance of the Ellipsoid class
+    offsets: array_like
+        Optional offsets of the rings: the vertices of ring i are
+        offsets[i]:offsets[i+1]. If omitted, all vertices form one ring
+
+    Returns
+    --------
+    float or ndarray
+        Area of each ring in square meters
+    float or ndarray
+        Perimeter of each ring in meters
+    """
+    phi = np.asarray(phi, dtype=float).ravel()
+    lamb = np.asarray(lamb, dtype=float).ravel()
+    ring, n_rings = _ring_ids(phi.size, offsets)
+    # Each vertex is joined to the next one, and the last vertex of a ring
+    # back to the first
+    nxt = np.arange(1, phi.size + 1)
+    last = np.ones(phi.size, dtype=bool)
+    last[:-1] = ring[:-1] != ring[1:]
+    starts = np.searchsorted(ring, np.arange(n_rings))
+    nxt[last] = starts[ring[last]]
+
+    s, alpha1, alpha2, _ = inverse_problem_batch(phi, lamb, phi[nxt], lamb[nxt], elip)
+    perimeter = np.bincount(ring, weights=s, minlength=n_rings)
+
+    beta, Rq = _authalic(phi, elip)
+    t1, t2 = np.tan(beta/2), np.tan(beta[nxt]/2)
+    dlamb = np.deg2rad((lamb[nxt] - lamb + 180) % 360 - 180)
+    S = 2*np.arctan2(np.tan(dlamb/2)*(t1 + t2), 1 + t1*t2)*Rq**2
+    far = s > SHORT_EDGE
+    S[far] = _geodesic_area(phi[far], phi[nxt][far], alpha1[far], alpha2[far], elip, Rq**2)
+    total = np.bincount(ring, weights=S, minlength=n_rings)
+
+    # A ring crossing the prime meridian an odd number of times encloses a
+    # pole (the transit rule of Karney, 2013)
+    lamb1 = (lamb + 180) % 360 - 180
+    lamb2 = lamb1[nxt]
+    cross = ((lamb1 <= 0) & (lamb2 > 0) & (dlamb > 0)).astype(int) - ((lamb2 <= 0) & (lamb1 > 0) & (dlamb < 0))
+    area0 = 4*np.pi*Rq**2
+    odd = np.bincount(ring, weights=cross, minlength=n_rings) % 2 == 1
+    total[odd] = np.where(total[odd] < 0, total[odd] + area0/2, total[odd] - area0/2)
+    area = np.abs(np.remainder(total + area0/2, area0) - area0/2)
+
+    if offsets is None:
+        return float(area[0]), float(perimeter[0])
+    return area, perimeter
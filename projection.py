@@ -0,0 +1,239 @@
+from functools import lru_cache
+
+import numpy as np
+
+# Coefficients of the Krüger series in the third flattening n (Karney, 2011),
+# as powers n, n², ..., n⁶ for each order j = 1..6
+_ALPHA = ((1/2, -2/3, 5/16, 41/180, -127/288, 7891/37800),
+          (0, 13/48, -3/5, 557/1440, 281/630, -1983433/1935360),
+          (0, 0, 61/240, -103/140, 15061/26880, 167603/181440),
+          (0, 0, 0, 49561/161280, -179/168, 6601661/7257600),
+          (0, 0, 0, 0, 34729/80640, -3418889/1995840),
+          (0, 0, 0, 0, 0, 212378941/319334400))
+_BETA = ((1/2, -2/3, 37/96, -1/360, -81/512, 96199/604800),
+         (0, 1/48, 1/15, -437/1440, 46/105, -1118711/3870720),
+         (0, 0, 17/480, -37/840, -209/4480, 5569/90720),
+         (0, 0, 0, 4397/161280, -11/504, -830251/7257600),
+         (0, 0, 0, 0, 4583/161280, -108847/3991680),
+         (0, 0, 0, 0, 0, 20648693/638668800))
+
+
+class TransverseMercator(object):
+    """
+    A class used to represent a Transverse Mercator projection, computed with
+    the Krüger series to the sixth order in n (accurate to a few nanometers
+    within 3900 km of the central meridian). The series coefficients are
+    computed once, on initialization.
+    For initialization, it requires:
+    elip -> instance of the Ellipsoid class
+    lamb0 -> central meridian in degrees
+    Optionally, it takes:
+    k0 -> scale factor on the central meridian (default 0.9996)
+    false_easting, false_northing -> in meters (default 500000 and 0)
+    """
+
+    def __init__(self, elip, lamb0, k0=0.9996, false_easting=500000.0, false_northing=0.0):
+        """
+        Parameters
+        ----------
+        elip : object
+            Instance of the Ellipsoid class
+        lamb0 : float
+            Central meridian in degrees
+        k0 : float
+            Scale factor on the central meridian
+        false_easting : float
+            Easting of the central meridian, in meters
+        false_northing : float
+            Northing of the equator, in meters
+        ---------
+        """
+        self.elip = elip
+        self.lamb0 = lamb0
+        self.k0 = k0
+        self.false_easting = false_easting
+        self.false_northing = false_northing
+        n = elip.n
+        powers = n**np.arange(1, 7)
+        self.alpha = np.array(_ALPHA) @ powers
+        self.beta = np.array(_BETA) @ powers
+        # Rectifying radius times the scale factor
+        self.kA = k0*elip.a/(1 + n)*(1 + n**2/4 + n**4/64 + n**6/256)
+        self._j2 = 2*np.arange(1, 7)
+
+    def forward(self, phi, lamb):
+        """
+        Projects geodetic coordinates
+
+        Parameters
+        ----------
+        phi : float or array_like
+            Latitude in degrees
+        lamb : float or array_like
+            Longitude in degrees
+
+        Returns
+        ---------
+        float or ndarray
+            Easting in meters
+        float or ndarray
+            Northing in meters
+        """
+        e = self.elip.e1
+        phi = np.deg2rad(phi)
+        dlamb = np.deg2rad((np.asarray(lamb, dtype=float) - self.lamb0 + 180) % 360 - 180)
+        sin_phi = np.sin(phi)
+        t = np.sinh(np.arctanh(sin_phi) - e*np.arctanh(e*sin_phi))
+        xi_p = np.arctan2(t, np.cos(dlamb))
+        eta_p = np.arctanh(np.sin(dlamb)/np.sqrt(1 + t**2))
+        j2 = self._j2.reshape((-1,) + (1,)*np.ndim(xi_p))
+        xi = xi_p + np.sum(self.alpha.reshape(j2.shape)*np.sin(j2*xi_p)*np.cosh(j2*eta_p), axis=0)
+        eta = eta_p + np.sum(self.alpha.reshape(j2.shape)*np.cos(j2*xi_p)*np.sinh(j2*eta_p), axis=0)
+        return self.false_easting + self.kA*eta, self.false_northing + self.kA*xi
+
+    def inverse(self, E, N):
+        """
+        Converts projected coordinates back to geodetic coordinates
+
+        Parameters
+        ----------
+        E : float or array_like
+            Easting in meters
+        N : float or array_like
+            Northing in meters
+
+        Returns
+        ---------
+        float or ndarray
+            Latitude in degrees
+        float or ndarray
+            Longitude in degrees, wrapped to [-180, 180)
+        """
+        e1_sq = self.elip.e1_sq
+        e = self.elip.e1
+        xi = (np.asarray(N, dtype=float) - self.false_northing)/self.kA
+        eta = (np.asarray(E, dtype=float) - self.false_easting)/self.kA
+        j2 = self._j2.reshape((-1,) + (1,)*np.ndim(xi))
+        beta = self.beta.reshape(j2.shape)
+        xi_p = xi - np.sum(beta*np.sin(j2*xi)*np.cosh(j2*eta), axis=0)
+        eta_p = eta - np.sum(beta*np.cos(j2*xi)*np.sinh(j2*eta), axis=0)
+        # Conformal latitude, then Newton's method for tan(phi)
+        tau_p = np.sin(xi_p)/np.hypot(np.sinh(eta_p), np.cos(xi_p))
+        tau = tau_p.copy()
+        for i in range(5):
+            sigma = np.sinh(e*np.arctanh(e*tau/np.sqrt(1 + tau**2)))
+            tau_i = tau*np.sqrt(1 + sigma**2) - sigma*np.sqrt(1 + tau**2)
+            dtau = ((tau_p - tau_i)/np.sqrt(1 + tau_i**2)
+                    * (1 + (1 - e1_sq)*tau**2)/((1 - e1_sq)*np.sqrt(1 + tau**2)))
+            tau = tau + dtau
+            if np.all(np.abs(dtau) < 1.0E-14*np.maximum(1, np.abs(tau))):
+                break
+        phi = np.rad2deg(np.arctan(tau))
+        lamb = self.lamb0 + np.rad2deg(np.arctan2(np.sinh(eta_p), np.cos(xi_p)))
+        return phi, (lamb + 180) % 360 - 180
+
+
+def utm_zone(phi, lamb):
+    """
+    UTM zone number of each point, with the exceptions of southwest Norway
+    (zone 32V) and Svalbard (zones 31X to 37X)
+
+    Parameters
+    ----------
+    phi : float or array_like
+        Latitude in degrees
+    lamb : float or array_like
+        Longitude in degrees
+    """
+    phi = np.asarray(phi, dtype=float)
+    lamb = (np.asarray(lamb, dtype=float) + 180) % 360 - 180
+    zone = np.minimum((lamb + 180)//6 + 1, 60).astype(int)
+    zone = np.where((phi >= 56) & (phi < 64) & (lamb >= 3) & (lamb < 12), 32, zone)
+    svalbard = (phi >= 72) & (phi < 84)
+    for lo, hi, z in ((0, 9, 31), (9, 21, 33), (21, 33, 35), (33, 42, 37)):
+        zone = np.where(svalbard & (lamb >= lo) & (lamb < hi), z, zone)
+    return zone
+
+
+@lru_cache(maxsize=None)
+def get_utm(elip, zone, south=False):
+    """
+    Returns the TransverseMercator of a UTM zone, building it only on the
+    first request for each (ellipsoid, zone, hemisphere)
+    """
+    if not 1 <= zone <= 60:
+        raise ValueError("UTM zones go from 1 to 60")
+    return TransverseMercator(elip, zone*6 - 183, 0.9996, 500000.0, 10000000.0 if south else 0.0)
+
+
+def geod2utm(phi, lamb, elip, zone=None):
+    """
+    Converts geodetic coordinates to UTM. Without a fixed zone, each point is
+    projected on its own zone and hemisphere: the points are grouped by zone
+    and every group is projected in one vectorized call.
+
+    Parameters
+    ----------
+    phi : float or array_like
+        Latitude in degrees
+    lamb : float or array_like
+        Longitude in degrees
+    elip : object
+        Instance of the Ellipsoid class
+    zone : int
+        Optional zone used for all the points
+
+    Returns
+    ---------
+    ndarray
+        Easting in meters
+    ndarray
+        Northing in meters
+    ndarray
+        Zone of each point
+    ndarray
+        True for the points in the southern hemisphere
+    """
+    phi, lamb = np.broadcast_arrays(np.asarray(phi, dtype=float), np.asarray(lamb, dtype=float))
+    zones = utm_zone(phi, lamb) if zone is None else np.full(phi.shape, zone)
+    south = phi < 0
+    E, N = np.empty(phi.shape), np.empty(phi.shape)
+    keys = zones*2 + south
+    for key in np.unique(keys):
+        mask = keys == key
+        E[mask], N[mask] = get_utm(elip, int(key//2), bool(key % 2)).forward(phi[mask], lamb[mask])
+    return E, N, zones, south
+
+
+def utm2geod(E, N, zone, south, elip):
+    """
+    Converts UTM coordinates to geodetic coordinates
+
+    Parameters
+    ----------
+    E : float or array_like
+        Easting in meters
+    N : float or array_like
+        Northing in meters
+    zone : int or array_like
+        Zone of each point
+    south : bool or array_like
+        True for the points in the southern hemisphere
+    elip : object
+        Instance of the Ellipsoid class
+
+    Returns
+    ---------
+    ndarray
+        Latitude in degrees
+    ndarray
+        Longitude in degrees
+    """
+    E, N, zone, south = np.broadcast_arrays(np.asarray(E, dtype=float), np.asarray(N, dtype=float),
+                                            np.asarray(zone, dtype=int), np.asarray(south, dtype=bool))
+    phi, lamb = np.empty(E.shape), np.empty(E.shape)
+    keys = zone*2 + south
+    for key in np.unique(keys):
+        mask = keys == key
+        phi[mask], lamb[mask] = get_utm(elip, int(key//2), bool(key % 2)).inverse(E[mask], N[mask])
+    return phi, lamb
@@ -0,0 +1,65 @@
+"""
+Binary cache of the parsed reference data files (ellipsoid.txt and
+conversion_parameters.dat).
+
+The first time a file is parsed, the result is pickled into the __pycache__
+directory next to it, the same way Python caches compiled modules. Later
+processes load the pickle instead of parsing the text again, for as long as
+the size and modification time of the file match. When the cache cannot be
+written (read-only installs, PYTHONDONTWRITEBYTECODE) the file is simply
+parsed on every first use.
+"""
+import os
+import pickle
+import sys
+
+CACHE_VERSION = 1
+
+
+def cache_path(source):
+    """
+    Path of the binary cache of the given reference file
+    """
+    directory, name = os.path.split(os.path.abspath(source))
+    return os.path.join(directory, "__pycache__", name + ".pickle")
+
+
+def load(source, parse):
+    """
+    Returns parse(source), loaded from the binary cache when it is up to date
+
+    Parameters
+    -----------
+    source: str
+        Path of the reference file
+    parse: callable
+        Function that parses the file, called with its path
+
+    Returns
+    --------
+    object
+        The parsed data
+    """
+    status = os.stat(source)
+    key = (CACHE_VERSION, status.st_size, status.st_mtime_ns)
+    path = cache_path(source)
+    try:
+        with open(path, "rb") as infile:
+            cached_key, data = pickle.load(infile)
+        if cached_key == key:
+            return data
+    except (OSError, EOFError, ValueError, TypeError, pickle.UnpicklingError, AttributeError, ImportError):
+        pass
+
+    data = parse(source)
+    if not sys.dont_write_bytecode:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written aside and renamed, so concurrent processes never read a partial file
+            tmp = "{}.{}.tmp".format(path, os.getpid())
+            with open(tmp, "wb") as outfile:
+                pickle.dump((key, data), outfile, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+    return data
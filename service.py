@@ -0,0 +1,352 @@
+"""
+Local geodesy compute service.
+
+A small asyncio HTTP server, over TCP or a Unix socket, that exposes the
+batch functions of the library. Requests for the same operation (and the
+same datums) that arrive within a short window are concatenated into one
+NumPy batch, solved by a single vectorized call, and each caller gets back
+its own slice. Batches of the iterative solvers above a threshold run on a
+process pool, so the event loop keeps accepting requests meanwhile.
+
+    python service.py --port 8765 --window 0.002 -j 4
+
+Each operation is a POST to /<operation> with a JSON object holding the
+input columns (lists or numbers) and, optionally, "ellipsoid" and "target":
+
+    POST /inverse_problem {"phi1": [-23.5], "lamb1": [-46.6], "phi2": [-22.9], "lamb2": [-43.2]}
+    -> {"s": [...], "alpha1": [...], "alpha2": [...], "converged": [...]}
+
+GET /operations lists the operations, GET /health answers {"status": "ok"}
+and GET /metrics returns the instrumentation data in the Prometheus format,
+including the data recorded by the pool workers, which is sent back with
+each batch.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import instrumentation
+from coordinate_conv import geod2cart, cart2geod
+from datum_conv import conv_geod_datum
+from ellipsoid import get_ellipsoid
+from vincenty_dist_formulae import inverse_problem_batch, problema_direto_batch
+
+# Input columns, output columns and whether the operation is heavy enough for
+# the process pool
+SERVICE_OPERATIONS = {
+    'inverse_problem': (('phi1', 'lamb1', 'phi2', 'lamb2'), ('s', 'alpha1', 'alpha2', 'converged'), True),
+    'problema_direto': (('phi1', 'lamb1', 'alpha1', 's'), ('phi2', 'lamb2', 'alpha2'), True),
+    'geod2cart': (('lamb', 'phi', 'h'), ('X', 'Y', 'Z'), False),
+    'cart2geod': (('X', 'Y', 'Z'), ('lamb', 'phi', 'h'), False),
+    'conv_geod_datum': (('lamb', 'phi', 'h'), ('lamb', 'phi', 'h'), False),
+}
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error'}
+# Largest request body accepted, in bytes
+MAX_BODY = 64*1024*1024
+
+
+def execute(operation, ellipsoid, target, columns):
+    """
+    Runs one batch of an operation. It is a module level function so the
+    process pool can call it
+
+    Parameters
+    -----------
+    operation: str
+        Name of the operation, a key of SERVICE_OPERATIONS
+    ellipsoid: str
+        Name of the ellipsoid of the input coordinates
+    target: str
+        Name of the target datum of conv_geod_datum
+    columns: list
+        1-D arrays with the input columns, in the order of SERVICE_OPERATIONS
+
+    Returns
+    --------
+    tuple
+        1-D arrays with the output columns
+    """
+    elip = get_ellipsoid(ellipsoid)
+    if operation == 'inverse_problem':
+        return inverse_problem_batch(*columns, elip)
+    if operation == 'problema_direto':
+        return problema_direto_batch(*columns, elip)
+    if operation == 'geod2cart':
+        return geod2cart(*columns, elip)
+    if operation == 'cart2geod':
+        return cart2geod(*columns, elip)
+    if operation == 'conv_geod_datum':
+        return conv_geod_datum(*columns, elip, get_ellipsoid(target))
+    raise KeyError(operation)
+
+
+def _execute_recorded(operation, ellipsoid, target, columns):
+    """
+    Runs execute in a pool worker with the instrumentation enabled, and
+    returns its outputs and the data it recorded, which the parent process
+    merges into its own
+    """
+    instrumentation.enable()
+    outputs = execute(operation, ellipsoid, target, columns)
+    return outputs, instrumentation.collect()
+
+
+class _Pending(object):
+    """
+    Requests waiting to be joined into the next batch of one operation
+    """
+
+    def __init__(self):
+        self.columns = []
+        self.futures = []
+        self.size = 0
+        self.timer = None
+
+
+class GeodesyService(object):
+    """
+    A class used to serve the library's operations, coalescing concurrent
+    requests into vectorized batches.
+    Optionally, it takes:
+    window -> seconds a batch stays open for more requests (default 0.002)
+    max_batch -> points that close a batch at once (default 65536)
+    jobs -> worker processes for the heavy operations; 0 runs everything in
+    the event loop (default 0)
+    pool_threshold -> smallest batch sent to the pool (default 256)
+    max_body -> largest request body in bytes (default MAX_BODY)
+    """
+
+    def __init__(self, window=0.002, max_batch=65536, jobs=0, pool_threshold=256, max_body=MAX_BODY):
+        """
+        Parameters
+        ----------
+        window : float
+            Seconds a batch stays open, counted from its first request
+        max_batch : int
+            Number of points that closes a batch before the window ends
+        jobs : int
+            Number of worker processes for the heavy operations
+        pool_threshold : int
+            Smallest batch of a heavy operation sent to the process pool;
+            smaller ones cost less to solve than to ship to a worker
+        max_body : int
+            Largest request body in bytes; larger ones are answered with 413
+        ---------
+        """
+        self.window = window
+        self.max_batch = max_batch
+        self.pool_threshold = pool_threshold
+        self.max_body = max_body
+        self.pool = ProcessPoolExecutor(max_workers=jobs) if jobs else None
+        self._pending = {}
+        # References to the running batches, which the event loop only holds
+        # weakly
+        self._tasks = set()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def _parse(self, operation, payload):
+        """
+        Validates a request and returns its batch key and input columns
+        """
+        if operation not in SERVICE_OPERATIONS:
+            raise KeyError(operation)
+        if not isinstance(payload, dict):
+            raise ValueError("the request body must be a JSON object")
+        inputs = SERVICE_OPERATIONS[operation][0]
+        missing = [name for name in inputs if name not in payload]
+        if missing:
+            raise ValueError("missing columns: {}".format(", ".join(missing)))
+        ellipsoid = payload.get('ellipsoid', 'SIRGAS2000')
+        target = payload.get('target')
+        try:
+            get_ellipsoid(ellipsoid)
+            if operation == 'conv_geod_datum':
+                if target is None:
+                    raise ValueError("conv_geod_datum requires a target datum")
+                get_ellipsoid(target)
+        except KeyError as error:
+            raise ValueError(error.args[0]) from None
+        try:
+            columns = np.broadcast_arrays(*(np.asarray(payload[name], dtype=float) for name in inputs))
+        except (TypeError, ValueError):
+            raise ValueError("the columns must be numbers or lists of numbers of the same length") from None
+        return (operation, ellipsoid, target), [np.ravel(c) for c in columns]
+
+    async def submit(self, operation, payload):
+        """
+        Queues a request in the open batch of its operation and waits for its
+        slice of the results
+
+        Returns
+        --------
+        dict
+            Output columns as lists
+        """
+        key, columns = self._parse(operation, payload)
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = _Pending()
+            pending.timer = asyncio.get_running_loop().call_later(self.window, self._flush, key)
+        future = asyncio.get_running_loop().create_future()
+        pending.columns.append(columns)
+        pending.futures.append(future)
+        pending.size += columns[0].size
+        if pending.size >= self.max_batch:
+            self._flush(key)
+        outputs = await future
+        names = SERVICE_OPERATIONS[operation][1]
+        return {name: np.asarray(values).tolist() for name, values in zip(names, outputs)}
+
+    def _flush(self, key):
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        pending.timer.cancel()
+        task = asyncio.ensure_future(self._run_batch(key, pending))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, key, pending):
+        operation, ellipsoid, target = key
+        sizes = [c[0].size for c in pending.columns]
+        columns = [np.concatenate(c) for c in zip(*pending.columns)]
+        start = time.perf_counter()
+        try:
+            if self.pool is not None and SERVICE_OPERATIONS[operation][2] and pending.size >= self.pool_threshold:
+                loop = asyncio.get_running_loop()
+                if instrumentation.is_enabled():
+                    outputs, metrics = await loop.run_in_executor(self.pool, _execute_recorded, operation,
+                                                                  ellipsoid, target, columns)
+                    instrumentation.merge(metrics)
+                else:
+                    outputs = await loop.run_in_executor(self.pool, execute, operation, ellipsoid, target, columns)
+            else:
+                outputs = execute(operation, ellipsoid, target, columns)
+        except Exception as error:
+            for future in pending.futures:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        if instrumentation.is_enabled():
+            instrumentation.record_call("service." + operation, time.perf_counter() - start, pending.size)
+        bounds = np.cumsum([0] + sizes)
+        outputs = [np.ravel(o) for o in outputs]
+        for future, i0, i1 in zip(pending.futures, bounds[:-1], bounds[1:]):
+            if not future.done():
+                future.set_result([o[i0:i1] for o in outputs])
+
+    async def _route(self, method, path, body):
+        """
+        Returns the status, content type and body of the response
+        """
+        name = path.split('?', 1)[0].strip('/')
+        if method == 'GET':
+            if name == 'health':
+                return 200, 'application/json', json.dumps({'status': 'ok'})
+            if name == 'operations':
+                return 200, 'application/json', json.dumps({op: {'inputs': spec[0], 'outputs': spec[1]}
+                                                            for op, spec in SERVICE_OPERATIONS.items()})
+            if name == 'metrics':
+                return 200, 'text/plain; version=0.0.4', instrumentation.prometheus_text()
+            return 404, 'application/json', json.dumps({'error': 'not found'})
+        if method != 'POST':
+            return 405, 'application/json', json.dumps({'error': 'use GET or POST'})
+        if name not in SERVICE_OPERATIONS:
+            return 404, 'application/json', json.dumps({'error': "unknown operation '{}'".format(name)})
+        try:
+            result = await self.submit(name, json.loads(body or b'{}'))
+        except ValueError as error:
+            return 400, 'application/json', json.dumps({'error': str(error)})
+        except Exception as error:
+            return 500, 'application/json', json.dumps({'error': repr(error)})
+        return 200, 'application/json', json.dumps(result)
+
+    async def handle(self, reader, writer):
+        """
+        Serves the HTTP/1.1 requests of one connection, keeping it alive
+        until the client closes it or asks to
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, path, version = line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b'\r\n', b'\n', b''):
+                        break
+                    field, _, value = header.decode('latin-1').partition(':')
+                    headers[field.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                if length > self.max_body or length < 0:
+                    # The body is not read, so the connection cannot be reused
+                    status, content_type, text = 413, 'application/json', json.dumps(
+                        {'error': 'request body larger than {} bytes'.format(self.max_body)})
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length)
+                    status, content_type, text = await self._route(method, path, body)
+                data = text.encode()
+                writer.write("HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n"
+                             .format(status, REASONS[status], content_type, len(data),
+                                     'keep-alive' if keep_alive else 'close').encode() + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765, unix=None):
+        """
+        Serves forever on the TCP address or, if given, on the Unix socket
+        """
+        if unix is not None:
+            if os.path.exists(unix):
+                os.unlink(unix)
+            server = await asyncio.start_unix_server(self.handle, path=unix)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serves the geodesy operations over HTTP, batching requests")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="TCP port to listen on")
+    parser.add_argument("--unix", help="Unix socket to listen on instead of TCP")
+    parser.add_argument("--window", type=float, default=0.002, help="seconds a batch stays open")
+    parser.add_argument("--max-batch", type=int, default=65536, help="points that close a batch at once")
+    parser.add_argument("-j", "--jobs", type=int, default=0, help="worker processes for the heavy operations")
+    parser.add_argument("--max-body", type=int, default=MAX_BODY, help="largest request body in bytes")
+    parser.add_argument("--metrics", action="store_true", help="record instrumentation data for /metrics")
+    args = parser.parse_args(argv)
+
+    if args.metrics:
+        instrumentation.enable()
+    service = GeodesyService(args.window, args.max_batch, args.jobs, max_body=args.max_body)
+    print("Listening on {}".format(args.unix or "http://{}:{}".format(args.host, args.port)))
+    try:
+        asyncio.run(service.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+import json
+import os
+
+import numpy as np
+from coordinate_conv import geod2cart
+from ellipsoid import Ellipsoid
+from vincenty_dist_formulae import inverse_problem_batch
+
+_ARRAYS = ("xyz", "phi", "lamb", "order", "start", "end", "left", "right", "lo", "hi", "split_dim")
+
+
+class GeodeticIndex(object):
+    """
+    A KD-tree over the ECEF coordinates (on the ellipsoid surface) of a set of
+    geodetic points. Since the chord between two points is never longer than
+    the geodesic joining them, the tree prunes candidates by chord distance and
+    the survivors are refined with the exact Vincenty inverse problem.
+    For initialization, it requires:
+    phi -> latitudes in decimal degrees
+    lamb -> longitudes in decimal degrees
+    elip -> instance of the Ellipsoid class
+    """
+
+    def __init__(self, phi, lamb, elip, leaf_size=32):
+        """
+        Parameters
+        ----------
+        phi : array_like
+            Latitudes in decimal degrees
+        lamb : array_like
+            Longitudes in decimal degrees
+        elip : object
+            Instance of the Ellipsoid class
+        leaf_size : int
+            Maximum number of points in a leaf of the tree
+        """
+        phi = np.asarray(phi, dtype=float).ravel()
+        lamb = np.asarray(lamb, dtype=float).ravel()
+        xyz = np.column_stack(geod2cart(lamb, phi, 0, elip))
+        order = np.arange(phi.size)
+        start, end, left, right, lo, hi, split_dim = [0], [phi.size], [-1], [-1], [], [], [-1]
+
+        node = 0
+        while node < len(start):
+            s, e = start[node], end[node]
+            pts = xyz[order[s:e]]
+            lo.append(pts.min(axis=0))
+            hi.append(pts.max(axis=0))
+            if e - s > leaf_size:
+                dim = int(np.argmax(hi[node] - lo[node]))
+                mid = (s + e) // 2
+                order[s:e] = order[s:e][np.argpartition(pts[:, dim], mid - s)]
+                left[node], right[node], split_dim[node] = len(start), len(start) + 1, dim
+                start += [s, mid]
+                end += [mid, e]
+                left += [-1, -1]
+                right += [-1, -1]
+                split_dim += [-1, -1]
+            node += 1
+
+        self.elip = elip
+        self.leaf_size = leaf_size
+        # Points are stored in tree order, so every node is a contiguous slice
+        self.order = order
+        self.xyz = xyz[order]
+        self.phi = phi[order]
+        self.lamb = lamb[order]
+        self.start, self.end = np.array(start), np.array(end)
+        self.left, self.right = np.array(left), np.array(right)
+        self.lo, self.hi = np.array(lo), np.array(hi)
+        self.split_dim = np.array(split_dim)
+
+    def __len__(self):
+        return self.phi.size
+
+    def save(self, path):
+        """
+        Saves the index as a directory of .npy files, which load() maps back
+        into memory without reading them
+
+        Parameters
+        ----------
+        path : str
+            Directory name
+        """
+        os.makedirs(path, exist_ok=True)
+        for name in _ARRAYS:
+            np.save(os.path.join(path, name + ".npy"), getattr(self, name))
+        with open(os.path.join(path, "index.json"), "w") as outfile:
+            json.dump({"a": self.elip.a, "f": self.elip.f, "leaf_size": self.leaf_size}, outfile)
+
+    @classmethod
+    def load(cls, path, elip=None, mmap=True):
+        """
+        Loads an index written by save()
+
+        Parameters
+        ----------
+        path : str
+            Directory name
+        elip : object
+            Instance of the Ellipsoid class. If omitted, it is rebuilt from
+            the saved semi-axis and flattening
+        mmap : bool
+            Whether to memory-map the arrays instead of reading them
+        """
+        with open(os.path.join(path, "index.json")) as infile:
+            meta = json.load(infile)
+        index = cls.__new__(cls)
+        index.elip = elip if elip is not None else Ellipsoid(meta["a"], meta["f"])
+        index.leaf_size = meta["leaf_size"]
+        for name in _ARRAYS:
+            setattr(index, name, np.load(os.path.join(path, name + ".npy"), mmap_mode="r" if mmap else None))
+        return index
+
+    def _candidates(self, q_xyz, r_chord):
+        """
+        Returns the pairs (query, position) whose chord distance is at most
+        r_chord[query]. All queries descend the tree together.
+        """
+        r2 = r_chord**2
+        qi = np.arange(q_xyz.shape[0])
+        nodes = np.zeros(qi.size, dtype=int)
+        leaf_q, leaf_n = [], []
+        while qi.size:
+            p = q_xyz[qi]
+            gap = np.maximum(np.maximum(self.lo[nodes] - p, p - self.hi[nodes]), 0)
+            keep = np.sum(gap**2, axis=1) <= r2[qi]
+            qi, nodes = qi[keep], nodes[keep]
+            is_leaf = self.left[nodes] < 0
+            leaf_q.append(qi[is_leaf])
+            leaf_n.append(nodes[is_leaf])
+            inner = nodes[~is_leaf]
+            qi = np.repeat(qi[~is_leaf], 2)
+            nodes = np.column_stack((self.left[inner], self.right[inner])).ravel()
+
+        qi, pos = _expand(np.concatenate(leaf_q), self.start[np.concatenate(leaf_n)],
+                          self.end[np.concatenate(leaf_n)])
+        keep = np.sum((self.xyz[pos] - q_xyz[qi])**2, axis=1) <= r2[qi]
+        return qi[keep], pos[keep]
+
+    def _geodesic(self, phi, lamb, qi, pos):
+        s, _, _, _ = inverse_problem_batch(phi[qi], lamb[qi], self.phi[pos], self.lamb[pos], self.elip)
+        return s
+
+    def query_radius(self, phi, lamb, radius):
+        """
+        Finds every indexed point whose ellipsoidal distance to each query
+        point is at most radius
+
+        Parameters
+        ----------
+        phi : array_like
+            Latitudes of the query points in decimal degrees
+        lamb : array_like
+            Longitudes of the query points in decimal degrees
+        radius : float or array_like
+            Search radius in meters, for all or for each query point
+
+        Returns
+        --------
+        ndarray
+            Offsets of shape (Q+1,): the results of query i are in the slice
+            offsets[i]:offsets[i+1] of the next two arrays
+        ndarray
+            Indices of the points found, in the order given to the constructor
+        ndarray
+            Ellipsoidal distances in meters, increasing within each query
+        """
+        phi = np.atleast_1d(np.asarray(phi, dtype=float))
+        lamb = np.atleast_1d(np.asarray(lamb, dtype=float))
+        radius = np.broadcast_to(np.asarray(radius, dtype=float), phi.shape)
+        q_xyz = np.column_stack(geod2cart(lamb, phi, 0, self.elip))
+        # A small margin keeps points exactly on the radius after rounding
+        qi, pos = self._candidates(q_xyz, radius*(1 + 1.0E-9) + 1.0E-6)
+        s = self._geodesic(phi, lamb, qi, pos)
+        keep = s <= radius[qi]
+        qi, pos, s = qi[keep], pos[keep], s[keep]
+        sort = np.lexsort((s, qi))
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(qi, minlength=phi.size))))
+        return offsets, self.order[pos[sort]], s[sort]
+
+    def query_knn(self, phi, lamb, k):
+        """
+        Finds the k indexed points closest to each query point
+
+        Parameters
+        ----------
+        phi : array_like
+            Latitudes of the query points in decimal degrees
+        lamb : array_like
+            Longitudes of the query points in decimal degrees
+        k : int
+            Number of neighbours
+
+        Returns
+        --------
+        ndarray
+            Indices of shape (Q, k) of the neighbours, in the order given to
+            the constructor, from the closest to the farthest
+        ndarray
+            Ellipsoidal distances of shape (Q, k) in meters
+        """
+        if not 0 < k <= len(self):
+            raise ValueError("k must be between 1 and the number of indexed points")
+        phi = np.atleast_1d(np.asarray(phi, dtype=float))
+        lamb = np.atleast_1d(np.asarray(lamb, dtype=float))
+        q_xyz = np.column_stack(geod2cart(lamb, phi, 0, self.elip))
+
+        # Descending to the smallest node that still holds k points gives k
+        # real points, and so an upper bound for the chord radius
+        nodes = np.zeros(phi.size, dtype=int)
+        while True:
+            inner = self.left[nodes] >= 0
+            dim = self.split_dim[nodes]
+            rows = np.arange(phi.size)
+            go_left = q_xyz[rows, dim] <= self.hi[self.left[nodes], dim]
+            child = np.where(go_left, self.left[nodes], self.right[nodes])
+            move = inner & (self.end[child] - self.start[child] >= k)
+            if not move.any():
+                break
+            nodes = np.where(move, child, nodes)
+        qi, pos = _expand(np.arange(phi.size), self.start[nodes], self.end[nodes])
+        chord = np.sqrt(np.sum((self.xyz[pos] - q_xyz[qi])**2, axis=1))
+        r_chord = _kth_smallest(qi, chord, k, phi.size)
+
+        # The k nearest by chord give an upper bound for the k-th geodesic
+        # distance, and every point within it has a chord no longer than it
+        qi, pos = self._candidates(q_xyz, r_chord*(1 + 1.0E-9) + 1.0E-6)
+        r_geod = _kth_smallest(qi, self._geodesic(phi, lamb, qi, pos), k, phi.size)
+        qi, pos = self._candidates(q_xyz, r_geod*(1 + 1.0E-9) + 1.0E-6)
+        s = self._geodesic(phi, lamb, qi, pos)
+
+        sort = np.lexsort((s, qi))
+        qi, pos, s = qi[sort], pos[sort], s[sort]
+        first = np.searchsorted(qi, np.arange(phi.size))
+        take = (first[:, None] + np.arange(k)).ravel()
+        return self.order[pos[take]].reshape(-1, k), s[take].reshape(-1, k)
+
+
+def _expand(qi, start, end):
+    """
+    Expands (query, start, end) ranges into (query, position) pairs
+    """
+    counts = end - start
+    total = counts.sum()
+    qi = np.repeat(qi, counts)
+    offset = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return qi, np.repeat(start, counts) + offset
+
+
+def _kth_smallest(qi, d, k, n):
+    """
+    k-th smallest value of d for each of the n queries, given that every
+    query has at least k values
+    """
+    sort = np.lexsort((d, qi))
+    first = np.searchsorted(qi[sort], np.arange(n))
+    return d[sort][first + k - 1]
@@ -0,0 +1,381 @@
+"""
+Terrain corrections from a gridded DEM.
+
+The correction of a point P at height hp is split in two zones around the
+DEM node nearest to P:
+
+- near zone: the (2*near_cells+1)² cells around the node, each one taken as
+  a vertical prism between hp and the height of the cell, and summed with
+  the exact formula of Nagy (1966);
+- far zone: every other cell up to radius, with the linear approximation
+  (G*ro/2)*sum((h - hp)²/r³*dA). Expanding the square turns it into three
+  convolutions (of h², h and the mask of valid cells) with the fixed kernel
+  dA/r³, which are computed with FFTs.
+
+The far zone formula is the first term of the attraction of a column of
+height dh at distance r, dA*(1/r - 1/sqrt(r² + dh²)), which it overestimates
+by about 3/4*(dh/r)², and it takes each cell as a point at its center. Both
+errors shrink as near_cells grows: on a synthetic DEM with 100 m cells and
+relief of 200 m, the corrections at the nodes are within 1.5% of a sum of
+exact prisms with near_cells=3. At stations away from their nearest node the
+far zone is still measured from the node, which adds up to about 4% with
+near_cells=3 and 1% with near_cells=8.
+
+The DEM is processed in tiles of nodes, each one read with a halo of radius
+around it, so it is never loaded whole, and the tiles can be spread over a
+pool of processes.
+"""
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from gravity import G
+
+# Shared by the worker processes, set once by _init_worker
+_state = {}
+
+
+class DEM(object):
+    """
+    A class used to represent a DEM on a regular grid of projected
+    coordinates. The heights are memory-mapped from a .npy file, rows from
+    south to north and columns from west to east, described by a .json header
+    written by save_dem.
+    For initialization, it requires:
+    path -> path of the .npy file
+    """
+
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        path : str
+            Path of the .npy file
+        heights : ndarray
+            Memory-mapped heights in meters, nan where there is no data
+        x0, y0 : float
+            Easting and northing of the southwest node in meters
+        dx, dy : float
+            Grid spacing in meters
+        ---------
+        """
+        self.path = path
+        with open(os.path.splitext(path)[0] + ".json") as infile:
+            header = json.load(infile)
+        self.heights = np.load(path, mmap_mode="r")
+        self.x0, self.y0 = header['x0'], header['y0']
+        self.dx, self.dy = header['dx'], header['dy']
+        self.nrows, self.ncols = self.heights.shape
+
+    def nearest_node(self, x, y):
+        """
+        Row and column of the node nearest to each point
+        """
+        row = np.rint((np.asarray(y, dtype=float) - self.y0)/self.dy).astype(int)
+        col = np.rint((np.asarray(x, dtype=float) - self.x0)/self.dx).astype(int)
+        return row, col
+
+
+def save_dem(path, heights, x0, y0, dx, dy, shape=None, block_rows=1024):
+    """
+    Saves a DEM in the format read by DEM. The heights are written to a
+    memory-mapped file block by block, so neither an array (which may itself
+    be memory-mapped) nor a stream of rows has to fit in memory.
+
+    Parameters
+    -----------
+    path: str
+        Path of the .npy file; the header goes next to it as .json
+    heights: array_like or iterable
+        Heights in meters, rows from south to north. It may also be an
+        iterable of rows, such as a generator reading a file
+    x0, y0: float
+        Easting and northing of the southwest node in meters
+    dx, dy: float
+        Grid spacing in meters
+    shape: tuple
+        (nrows, ncols) of the grid, required when heights is an iterator
+    block_rows: int
+        Number of rows copied at a time from an array
+    """
+    if shape is None:
+        if not hasattr(heights, "__len__"):
+            raise ValueError("shape is required when heights is an iterator of rows")
+        heights = np.asanyarray(heights)
+        shape = heights.shape
+    values = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=tuple(shape))
+    if isinstance(heights, np.ndarray):
+        for i in range(0, shape[0], block_rows):
+            values[i:i + block_rows] = heights[i:i + block_rows]
+    else:
+        nrows = 0
+        for row in heights:
+            if nrows == shape[0]:
+                raise ValueError("heights has more than {} rows".format(shape[0]))
+            values[nrows] = row
+            nrows += 1
+        if nrows != shape[0]:
+            raise ValueError("heights has {} rows, expected {}".format(nrows, shape[0]))
+    values.flush()
+    del values
+    with open(os.path.splitext(path)[0] + ".json", "w") as outfile:
+        json.dump({'x0': x0, 'y0': y0, 'dx': dx, 'dy': dy}, outfile)
+
+
+def prism_attraction(x1, x2, y1, y2, z1, z2, ro=2670):
+    """
+    Magnitude of the vertical attraction of a rectangular prism of density ro
+    at the origin (Nagy, 1966). The limits are relative to the point and may
+    be arrays.
+
+    Returns
+    --------
+    float or ndarray
+        Vertical attraction in m/s²
+    """
+    total = 0.0
+    for i, x in enumerate((x1, x2)):
+        for j, y in enumerate((y1, y2)):
+            for k, z in enumerate((z1, z2)):
+                r = np.sqrt(x*x + y*y + z*z)
+                # x*ln(y+r) vanishes with x even where y+r is 0
+                term = (x*np.log(np.maximum(y + r, 1.0E-300)) + y*np.log(np.maximum(x + r, 1.0E-300))
+                        - z*np.arctan2(x*y, z*r))
+                total = total + (-1)**(i + j + k)*term
+    return G*ro*np.abs(total)
+
+
+def _kernel(dx, dy, hy, hx, near_cells, radius):
+    """
+    Far zone kernel dA/r³ over (2hy+1, 2hx+1) cells, zero inside the near
+    zone and for the cells whose centers are beyond radius
+    """
+    j, i = np.meshgrid(np.arange(-hx, hx + 1), np.arange(-hy, hy + 1))
+    r = np.hypot(i*dy, j*dx)
+    far = ((np.abs(i) > near_cells) | (np.abs(j) > near_cells)) & (r <= radius)
+    K = np.zeros(r.shape)
+    K[far] = dx*dy/r[far]**3
+    return K
+
+
+class _TileSolver(object):
+    """
+    Computes the far zone convolutions and the near zone prism sums of one
+    tile of nodes. The kernel transform is computed once and reused by every
+    tile, since all the windows have the same shape.
+    """
+
+    def __init__(self, dem, tile_size, radius, near_cells):
+        self.dem = dem
+        self.tile_size = tile_size
+        self.near_cells = near_cells
+        self.hy = max(int(np.ceil(radius/dem.dy)), near_cells)
+        self.hx = max(int(np.ceil(radius/dem.dx)), near_cells)
+        self.shape = (tile_size + 2*self.hy, tile_size + 2*self.hx)
+        K = _kernel(dem.dx, dem.dy, self.hy, self.hx, near_cells, radius)
+        # Kernel centered on index (0, 0), wrapping around: the nodes of the
+        # tile are hy, hx cells away from the borders of the window, so the
+        # circular convolution never wraps for them
+        wrapped = np.zeros(self.shape)
+        wrapped[:K.shape[0], :K.shape[1]] = K
+        wrapped = np.roll(wrapped, (-self.hy, -self.hx), axis=(0, 1))
+        self.K_hat = np.fft.rfft2(wrapped)
+
+    def window(self, r0, c0):
+        """
+        Heights and mask of valid cells of the window around the tile whose
+        first node is (r0, c0), with zeros outside the DEM
+        """
+        dem = self.dem
+        h = np.zeros(self.shape)
+        top, left = r0 - self.hy, c0 - self.hx
+        a0, a1 = max(top, 0), min(top + self.shape[0], dem.nrows)
+        b0, b1 = max(left, 0), min(left + self.shape[1], dem.ncols)
+        h[a0 - top:a1 - top, b0 - left:b1 - left] = dem.heights[a0:a1, b0:b1]
+        mask = np.zeros(self.shape)
+        mask[a0 - top:a1 - top, b0 - left:b1 - left] = 1.0
+        mask[np.isnan(h)] = 0.0
+        h[np.isnan(h)] = 0.0
+        return h, mask
+
+    def convolve(self, f):
+        return np.fft.irfft2(np.fft.rfft2(f)*self.K_hat, s=self.shape)
+
+    def correct(self, r0, c0, rows, cols, xs=None, ys=None, hp=None, ro=2670):
+        """
+        Terrain corrections at the nodes (rows, cols) of the tile starting at
+        (r0, c0), or at the points (xs, ys, hp) whose nearest nodes they are
+
+        Returns
+        --------
+        ndarray
+            Terrain corrections in m/s²
+        """
+        dem = self.dem
+        h, mask = self.window(r0, c0)
+        a, b = rows - r0 + self.hy, cols - c0 + self.hx
+        if hp is None:
+            hp = h[a, b]
+            dx_p = dy_p = 0.0
+        else:
+            dx_p = xs - (dem.x0 + cols*dem.dx)
+            dy_p = ys - (dem.y0 + rows*dem.dy)
+
+        Ch2, Ch, C1 = (self.convolve(f)[a, b] for f in (h*h, h, mask))
+        tc = G*ro/2*(Ch2 - 2*hp*Ch + hp*hp*C1)
+
+        m = self.near_cells
+        for i in range(-m, m + 1):
+            for j in range(-m, m + 1):
+                dh = h[a + i, b + j] - hp
+                y1, x1 = (i - 0.5)*dem.dy - dy_p, (j - 0.5)*dem.dx - dx_p
+                near = prism_attraction(x1, x1 + dem.dx, y1, y1 + dem.dy, 0.0, dh, ro)
+                tc += np.where(mask[a + i, b + j] > 0, near, 0.0)
+        return tc
+
+    def correct_tile(self, r0, r1, c0, c1, ro=2670):
+        """
+        Terrain corrections at every node of rows r0:r1 and columns c0:c1,
+        nan where the DEM has no data
+        """
+        rows, cols = np.mgrid[r0:r1, c0:c1]
+        tc = self.correct(r0, c0, rows.ravel(), cols.ravel(), ro=ro).reshape(r1 - r0, c1 - c0)
+        return np.where(np.isnan(self.dem.heights[r0:r1, c0:c1]), np.nan, tc)
+
+    def run(self, task, ro=2670):
+        """
+        Solves a task: the bounds (r0, r1, c0, c1) of a tile of nodes, or
+        (r0, c0, rows, cols, xs, ys, hp) for the stations of a tile
+        """
+        if len(task) == 4:
+            return self.correct_tile(*task, ro=ro)
+        return self.correct(*task, ro=ro)
+
+
+def _init_worker(path, tile_size, radius, near_cells, ro):
+    dem = DEM(path)
+    _state.update(solver=_TileSolver(dem, tile_size, radius, near_cells), ro=ro)
+
+
+def _worker(task):
+    return _state['solver'].run(task, _state['ro'])
+
+
+def _run(dem, tasks, tile_size, radius, near_cells, ro, n_jobs):
+    """
+    Yields (task, result) in order. The tasks are consumed lazily: with a
+    pool, at most two per worker are in flight at any time
+    """
+    if n_jobs == 1:
+        solver = _TileSolver(dem, tile_size, radius, near_cells)
+        for task in tasks:
+            yield task, solver.run(task, ro)
+        return
+    n_jobs = n_jobs or os.cpu_count()
+    initargs = (dem.path, tile_size, radius, near_cells, ro)
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=initargs) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append((task, pool.submit(_worker, task)))
+            if len(pending) >= 2*n_jobs:
+                task, future = pending.popleft()
+                yield task, future.result()
+        while pending:
+            task, future = pending.popleft()
+            yield task, future.result()
+
+
+def terrain_correction_grid(dem, ro=2670, radius=20000.0, near_cells=4, tile_size=256, n_jobs=1, out=None):
+    """
+    Calculates the terrain correction at every node of a DEM
+
+    Parameters
+    -----------
+    dem: object or str
+        Instance of the DEM class or path of its .npy file
+    ro: float
+        Density of the topography in kg/m³
+    radius: float
+        Radius of the far zone in meters
+    near_cells: int
+        Half width, in cells, of the near zone summed with exact prisms
+    tile_size: int
+        Number of rows and columns of nodes of each tile
+    n_jobs: int
+        Number of worker processes. Use None for one per CPU
+    out: str or ndarray
+        Optional output. If it is a file name, the corrections are written to
+        a memory-mapped file so they never have to fit in memory
+
+    Returns
+    --------
+    ndarray or memmap
+        Terrain corrections in m/s², with the shape of the DEM (nan where the
+        DEM has no data)
+    """
+    if isinstance(dem, (str, os.PathLike)):
+        dem = DEM(dem)
+    shape = dem.heights.shape
+    filename = None
+    if isinstance(out, (str, os.PathLike)):
+        filename = out
+        out = np.memmap(filename, dtype=np.float64, mode='w+', shape=shape)
+    elif out is None:
+        out = np.empty(shape)
+    elif out.shape != shape:
+        raise ValueError("out must have shape {}".format(shape))
+
+    # Only the bounds of each tile; the solver builds the node indices
+    tasks = ((r0, min(r0 + tile_size, shape[0]), c0, min(c0 + tile_size, shape[1]))
+             for r0 in range(0, shape[0], tile_size) for c0 in range(0, shape[1], tile_size))
+    for (r0, r1, c0, c1), tc in _run(dem, tasks, tile_size, radius, near_cells, ro, n_jobs):
+        out[r0:r1, c0:c1] = tc
+
+    if filename is not None:
+        out.flush()
+    return out
+
+
+def terrain_correction(x, y, H, dem, ro=2670, radius=20000.0, near_cells=4, tile_size=256, n_jobs=1):
+    """
+    Calculates the terrain correction at a set of stations. The stations are
+    grouped by the tile of their nearest DEM node, and each tile is processed
+    once for all of its stations.
+
+    Parameters
+    -----------
+    x, y: array_like
+        Easting and northing of the stations in meters, in the DEM grid
+    H: array_like
+        Orthometric altitudes of the stations in meters
+    dem: object or str
+        Instance of the DEM class or path of its .npy file
+    ro, radius, near_cells, tile_size, n_jobs:
+        See terrain_correction_grid
+
+    Returns
+    --------
+    ndarray
+        Terrain corrections in m/s², nan for the stations outside the DEM
+    """
+    if isinstance(dem, (str, os.PathLike)):
+        dem = DEM(dem)
+    x, y, H = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float),
+                                  np.asarray(H, dtype=float))
+    shape = x.shape
+    x, y, H = x.ravel(), y.ravel(), H.ravel()
+    rows, cols = dem.nearest_node(x, y)
+    inside = np.nonzero((rows >= 0) & (rows < dem.nrows) & (cols >= 0) & (cols < dem.ncols))[0]
+
+    tile = (rows[inside]//tile_size)*(dem.ncols//tile_size + 1) + cols[inside]//tile_size
+    order = inside[np.argsort(tile, kind='stable')]
+    groups = np.split(order, np.nonzero(np.diff(np.sort(tile)))[0] + 1) if order.size else []
+    tasks = (((rows[g[0]]//tile_size)*tile_size, (cols[g[0]]//tile_size)*tile_size, rows[g], cols[g],
+              x[g], y[g], H[g]) for g in groups)
+
+    tc = np.full(x.shape, np.nan)
+    for g, (_, result) in zip(groups, _run(dem, tasks, tile_size, radius, near_cells, ro, n_jobs)):
+        tc[g] = result
+    return tc.reshape(shape)
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from coordinate_conv import dms2degrees
+
+TRIPLES = [[10, 30, 0], [20, 15, 0], [30, 0, 0], [-0.0, 30, 0]]
+DEGREES = [10.5, 20.25, 30.0, -0.5]
+
+
+@pytest.mark.parametrize("n", [1, 2, 3, 4])
+@pytest.mark.parametrize("kind", [list, tuple, np.array])
+def test_dms2degrees_rows(kind, n):
+    coord = kind([kind(t) if kind is not np.array else t for t in TRIPLES[:n]])
+    np.testing.assert_array_equal(dms2degrees(coord), DEGREES[:n])
+
+
+@pytest.mark.parametrize("kind", [list, tuple, np.array])
+def test_dms2degrees_single(kind):
+    assert dms2degrees(kind([-23, 30, 36])) == pytest.approx(-23.51)
+
+
+def test_dms2degrees_components():
+    d, m, s = np.array(TRIPLES).T
+    np.testing.assert_array_equal(dms2degrees([d, m, s]), DEGREES)
+    np.testing.assert_array_equal(dms2degrees((d, m, s)), DEGREES)
+
+
+def test_dms2degrees_shape():
+    with pytest.raises(ValueError):
+        dms2degrees([[10, 30], [20, 15]])
@@ -0,0 +1,28 @@
+import numpy as np
+
+import datum_conv
+from datum_conv import get_transformer
+from ellipsoid import Ellipsoid, get_ellipsoid
+
+
+def test_get_transformer_reuses_the_transformer():
+    assert get_transformer("SIRGAS2000", "SAD69") is get_transformer(get_ellipsoid("SIRGAS2000"), "SAD69")
+
+
+def test_get_transformer_follows_new_parameters(monkeypatch):
+    old = get_transformer("SIRGAS2000", "SAD69")
+    parameters = datum_conv._get_parameters()
+    monkeypatch.setitem(parameters, "SIRGAS20002SAD69", dict(parameters["SIRGAS20002SAD69"], dx=1.0))
+    new = get_transformer("SIRGAS2000", "SAD69")
+    assert new is not old
+    assert new.T[0] == 1.0
+    monkeypatch.undo()
+    np.testing.assert_array_equal(get_transformer("SIRGAS2000", "SAD69").T, old.T)
+
+
+def test_get_transformer_follows_new_ellipsoids():
+    sad69 = get_ellipsoid("SAD69")
+    other = Ellipsoid(sad69.a + 100.0, sad69.f, "SAD69")
+    transformer = get_transformer("SIRGAS2000", other)
+    assert transformer.elip2 is other
+    assert get_transformer("SIRGAS2000", sad69).elip2 is sad69
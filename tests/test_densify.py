@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from ellipsoid import get_ellipsoid
+from vincenty_dist_formulae import densify, inverse_problem_batch
+
+
+@pytest.fixture
+def elip():
+    return get_ellipsoid("WGS84")
+
+
+def test_densify_spacing(elip):
+    phi, lamb, offsets, converged = densify([-23.5, 0.0], [-46.6, 10.0], [-22.9, 1.0], [-43.2, 10.0], elip,
+                                            spacing=10000.0)
+    assert converged.all()
+    assert offsets[0] == 0 and offsets[-1] == phi.size
+    for i0, i1 in zip(offsets[:-1], offsets[1:]):
+        s, _, _, _ = inverse_problem_batch(phi[i0:i1 - 1], lamb[i0:i1 - 1], phi[i0 + 1:i1], lamb[i0 + 1:i1], elip)
+        np.testing.assert_allclose(s[:-1], 10000.0, rtol=1.0E-9)
+        assert 0 < s[-1] <= 10000.0
+
+
+def test_densify_wraps_every_longitude(elip):
+    _, lamb, _, _ = densify(10.0, 170.0, 10.0, 190.0, elip, n_points=5)
+    assert np.all((lamb >= -180) & (lamb < 180))
+    assert lamb[-1] == pytest.approx(-170.0)
+
+
+@pytest.mark.parametrize("spacing", [0.0, -1.0, np.nan, np.inf])
+def test_densify_rejects_spacing(elip, spacing):
+    with pytest.raises(ValueError):
+        densify(0.0, 0.0, 1.0, 1.0, elip, spacing=spacing)
+
+
+def test_densify_rejects_non_finite_distance(elip):
+    with pytest.raises(ValueError):
+        densify(np.nan, 0.0, 1.0, 1.0, elip, spacing=1000.0)
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+import instrumentation
+from ellipsoid import get_ellipsoid
+from vincenty_dist_formulae import problema_direto_batch
+
+
+@pytest.fixture
+def enabled():
+    instrumentation.reset()
+    instrumentation.enable()
+    yield
+    instrumentation.disable()
+    instrumentation.reset()
+
+
+def test_broadcast_batch_size(enabled):
+    az, s = np.arange(5.0)[:, None]*10, np.arange(1, 5)*1.0E4
+    problema_direto_batch(0.0, 0.0, az, s, get_ellipsoid("WGS84"))
+    m = instrumentation.stats()['problema_direto_batch']
+    assert m['batch_size']['sum'] == 20
+    assert m['iterations']['count'] == 20
+
+
+def test_collect_and_merge(enabled):
+    problema_direto_batch([0.0, 1.0], 0.0, 45.0, 1.0E5, get_ellipsoid("WGS84"))
+    metrics = instrumentation.collect()
+    assert instrumentation.stats() == {}
+    instrumentation.merge(metrics)
+    instrumentation.merge(metrics)
+    m = instrumentation.stats()['problema_direto_batch']
+    assert m['calls'] == 2
+    assert m['batch_size']['sum'] == 4
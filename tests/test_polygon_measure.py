@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from ellipsoid import get_ellipsoid
+from polygon_measure import polygon_area_perimeter, polyline_length
+
+# Area (m²) and perimeter (m) of geodesic polygons on WGS84 computed with
+# geographiclib 2.0 (Geodesic.Polygon)
+POLYGONS = [
+    ([0, 0, 1, 1], [0, 1, 1, 0], 12308778361.469452, 443770.91724830196),
+    ([-10, -10, 10, 10], [-20, 20, 20, -20], 10206356185319.967, 13188930.189975798),
+    ([70, 75, 80], [0, 60, -30], 1306615279845.8633, 5376524.801745131),
+    ([-23, -23.1, -23.05], [-46, -46, -46.1], 56748222.415462494, 34371.865852672534),
+    # Around the north pole and across the antimeridian
+    ([80, 80, 80, 80], [0, 90, 180, -90], 2507270031169.875, 6301599.963614223),
+    ([10, 10, 12], [179, -179, 180], 24240263677.71646, 712775.9823617232),
+]
+
+# Length (m) of geodesic polylines on WGS84 computed with geographiclib 2.0
+# (Geodesic.Polygon with polyline=True)
+POLYLINES = [
+    ([0, 0, 1, 1], [0, 1, 1, 0], 333196.52869050315),
+    ([-23.5, -22.9, -15.8], [-46.6, -43.2, -47.9], 1282315.6692481532),
+    ([10, 10, 12], [179, -179, 180], 466027.18738333473),
+    ([-10, 80], [0, 100], 11284636.853608318),
+]
+
+
+@pytest.fixture
+def elip():
+    return get_ellipsoid("WGS84")
+
+
+@pytest.mark.parametrize("phi, lamb, area, perimeter", POLYGONS)
+def test_polygon_area_perimeter(elip, phi, lamb, area, perimeter):
+    a, p = polygon_area_perimeter(phi, lamb, elip)
+    assert a == pytest.approx(area, rel=1.0E-10, abs=1.0)
+    assert p == pytest.approx(perimeter, rel=1.0E-9)
+
+
+def test_several_rings(elip):
+    phi = np.concatenate([np.asarray(P[0], dtype=float) for P in POLYGONS])
+    lamb = np.concatenate([np.asarray(P[1], dtype=float) for P in POLYGONS])
+    offsets = np.cumsum([0] + [len(P[0]) for P in POLYGONS])
+    area, perimeter = polygon_area_perimeter(phi, lamb, elip, offsets)
+    np.testing.assert_allclose(area, [P[2] for P in POLYGONS], rtol=1.0E-10, atol=1.0)
+    np.testing.assert_allclose(perimeter, [P[3] for P in POLYGONS], rtol=1.0E-9)
+
+
+def test_closed_ring_and_orientation(elip):
+    phi, lamb, area, _ = POLYGONS[0]
+    assert polygon_area_perimeter(phi + phi[:1], lamb + lamb[:1], elip)[0] == pytest.approx(area, rel=1.0E-10)
+    assert polygon_area_perimeter(phi[::-1], lamb[::-1], elip)[0] == pytest.approx(area, rel=1.0E-10)
+
+
+@pytest.mark.parametrize("phi, lamb, length", POLYLINES)
+def test_polyline_length(elip, phi, lamb, length):
+    assert polyline_length(phi, lamb, elip) == pytest.approx(length, rel=1.0E-9)
+
+
+def test_several_polylines(elip):
+    phi = np.concatenate([np.asarray(P[0], dtype=float) for P in POLYLINES])
+    lamb = np.concatenate([np.asarray(P[1], dtype=float) for P in POLYLINES])
+    offsets = np.cumsum([0] + [len(P[0]) for P in POLYLINES])
+    np.testing.assert_allclose(polyline_length(phi, lamb, elip, offsets), [P[2] for P in POLYLINES], rtol=1.0E-9)
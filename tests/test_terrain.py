@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from terrain import DEM, prism_attraction, save_dem, terrain_correction, terrain_correction_grid
+
+
+@pytest.fixture
+def heights():
+    rng = np.random.default_rng(0)
+    return rng.uniform(0, 1500, (50, 40)).astype(np.float32)
+
+
+def test_save_dem_from_array(tmp_path, heights):
+    path = str(tmp_path / "dem.npy")
+    save_dem(path, heights, 1000.0, 2000.0, 30.0, 25.0, block_rows=7)
+    dem = DEM(path)
+    np.testing.assert_array_equal(dem.heights, heights)
+    assert (dem.x0, dem.y0, dem.dx, dem.dy) == (1000.0, 2000.0, 30.0, 25.0)
+
+
+def test_save_dem_from_rows(tmp_path, heights):
+    path = str(tmp_path / "dem.npy")
+    save_dem(path, (row.tolist() for row in heights), 0.0, 0.0, 30.0, 30.0, shape=heights.shape)
+    np.testing.assert_array_equal(DEM(path).heights, heights)
+
+
+def test_save_dem_checks_the_rows(tmp_path, heights):
+    path = str(tmp_path / "dem.npy")
+    with pytest.raises(ValueError):
+        save_dem(path, iter(heights), 0.0, 0.0, 30.0, 30.0)
+    with pytest.raises(ValueError):
+        save_dem(path, iter(heights[:-1]), 0.0, 0.0, 30.0, 30.0, shape=heights.shape)
+    with pytest.raises(ValueError):
+        save_dem(path, iter(heights), 0.0, 0.0, 30.0, 30.0, shape=(10, 40))
+
+
+@pytest.fixture
+def relief(tmp_path):
+    """
+    Synthetic DEM of 31x31 cells of 100 m with 200 m of relief
+    """
+    yy, xx = np.mgrid[0:31, 0:31]
+    path = str(tmp_path / "relief.npy")
+    save_dem(path, 500 + 100*np.sin(xx/4.0)*np.cos(yy/3.0), 0.0, 0.0, 100.0, 100.0)
+    return DEM(path)
+
+
+def prism_sum(dem, x, y, hp, radius):
+    """
+    Terrain correction at (x, y, hp) as the sum of the exact prisms of every
+    cell whose center is within radius of the nearest node
+    """
+    r, c = dem.nearest_node(x, y)
+    yy, xx = np.mgrid[0:dem.nrows, 0:dem.ncols]
+    xc, yc = dem.x0 + xx*dem.dx, dem.y0 + yy*dem.dy
+    sel = np.hypot(xc - (dem.x0 + c*dem.dx), yc - (dem.y0 + r*dem.dy)) <= radius
+    x1, y1 = xc[sel] - dem.dx/2 - x, yc[sel] - dem.dy/2 - y
+    return prism_attraction(x1, x1 + dem.dx, y1, y1 + dem.dy, 0.0, dem.heights[sel] - hp).sum()
+
+
+def test_terrain_correction_grid(relief):
+    # The linearized far zone stays within 2% of the exact prisms (see the
+    # module docstring)
+    tc = terrain_correction_grid(relief, radius=1000.0, near_cells=3, tile_size=8)
+    ref = np.array([[prism_sum(relief, c*100.0, r*100.0, relief.heights[r, c], 1000.0)
+                     for c in range(0, 31, 3)] for r in range(0, 31, 3)])
+    np.testing.assert_allclose(tc[::3, ::3], ref, rtol=0.02)
+
+
+def test_terrain_correction_stations(relief):
+    rng = np.random.default_rng(1)
+    x, y = rng.uniform(0, 3000, 40), rng.uniform(0, 3000, 40)
+    r, c = relief.nearest_node(x, y)
+    H = relief.heights[r, c] + rng.uniform(-20, 20, 40)
+    tc = terrain_correction(x, y, H, relief, radius=1000.0, near_cells=3, tile_size=8)
+    ref = np.array([prism_sum(relief, *p, 1000.0) for p in zip(x, y, H)])
+    # Stations away from their node add the error of measuring the far zone
+    # from the node
+    np.testing.assert_allclose(tc, ref, rtol=0.05)
+    assert np.isnan(terrain_correction(-500.0, 0.0, 500.0, relief, radius=1000.0))
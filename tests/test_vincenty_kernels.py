@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+
+import instrumentation
+import vincenty_kernels
+from ellipsoid import get_ellipsoid
+from vincenty_dist_formulae import inverse_problem_batch, problema_direto_batch
+from vincenty_kernels import ANGLE_TOL, DISTANCE_TOL
+
+N = 2000
+
+
+def angle_diff(x, y):
+    return np.abs((np.asarray(x) - np.asarray(y) + 180) % 360 - 180)
+
+
+@pytest.fixture(params=["python", "numba"])
+def kernels(request, monkeypatch):
+    """
+    The kernels module, running compiled with numba or as the plain Python
+    fallback (the original functions behind the numba dispatchers)
+    """
+    if request.param == "numba":
+        if not vincenty_kernels.NUMBA_AVAILABLE:
+            pytest.skip("numba is not installed")
+    elif vincenty_kernels.NUMBA_AVAILABLE:
+        for name in ("_inverse_pair", "_direct_pair", "_inverse_loop", "_direct_loop"):
+            monkeypatch.setattr(vincenty_kernels, name, getattr(vincenty_kernels, name).py_func)
+    return vincenty_kernels
+
+
+@pytest.fixture
+def elip():
+    return get_ellipsoid("WGS84")
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(0)
+    phi1, phi2 = rng.uniform(-89, 89, N), rng.uniform(-89, 89, N)
+    lamb1, lamb2 = rng.uniform(-180, 180, N), rng.uniform(-180, 180, N)
+    # Short baselines and nearly antipodal pairs, the hard cases of the inverse problem
+    phi2[:200] = phi1[:200] + rng.uniform(-0.01, 0.01, 200)
+    lamb2[:200] = lamb1[:200] + rng.uniform(-0.01, 0.01, 200)
+    phi2[200:400] = -phi1[200:400] + rng.uniform(-0.5, 0.5, 200)
+    lamb2[200:400] = lamb1[200:400] + 180 + rng.uniform(-0.5, 0.5, 200)
+    return phi1, lamb1, phi2, lamb2
+
+
+def test_inverse_problem(kernels, elip, points):
+    ref = inverse_problem_batch(*points, elip)
+    res = kernels.inverse_problem(*points, elip)
+    np.testing.assert_array_equal(res[3], ref[3])
+    ok = ref[3]
+    assert ok.sum() > 0.9*N
+    assert np.max(np.abs(res[0] - ref[0])[ok]) < DISTANCE_TOL
+    for k in (1, 2):
+        diff = angle_diff(res[k], ref[k])[ok]
+        # The azimuths of short lines are ill-conditioned (2E-11 degrees was
+        # measured on a 650 m line), so an azimuth also passes when the
+        # displacement it causes at the far end of the line is within the
+        # distance tolerance
+        assert np.all((diff < ANGLE_TOL) | (np.radians(diff)*ref[0][ok] < DISTANCE_TOL))
+
+
+def test_problema_direto(kernels, elip, points):
+    rng = np.random.default_rng(1)
+    phi1, lamb1 = points[:2]
+    alpha1, s = rng.uniform(0, 360, N), rng.uniform(0, 2.0E7, N)
+    ref = problema_direto_batch(phi1, lamb1, alpha1, s, elip)
+    res = kernels.problema_direto(phi1, lamb1, alpha1, s, elip)
+    assert np.max(np.abs(res[0] - ref[0])) < ANGLE_TOL
+    assert np.max(angle_diff(res[1], ref[1])) < ANGLE_TOL
+    assert np.max(angle_diff(res[2], ref[2])) < ANGLE_TOL
+
+
+def test_shapes_and_broadcasting(kernels, elip):
+    s, alpha1, alpha2, converged = kernels.inverse_problem(np.zeros((2, 3)), 0.0, 10.0, np.arange(3.0), elip)
+    assert s.shape == alpha1.shape == alpha2.shape == converged.shape == (2, 3)
+    phi2, lamb2, alpha2 = kernels.problema_direto(0.0, 0.0, [0.0, 90.0], 1000.0, elip)
+    assert phi2.shape == (2,)
+
+
+def test_compare_backends(kernels, elip):
+    diffs = kernels.compare_backends(elip, n=500)
+    assert diffs['s'] < DISTANCE_TOL
+    assert max(v for k, v in diffs.items() if k != 's') < ANGLE_TOL
+
+
+@pytest.fixture
+def metrics():
+    """
+    Discards the instrumentation data recorded by the test
+    """
+    yield
+    instrumentation.reset()
+
+
+def test_iteration_counts(kernels, elip, points, monkeypatch, metrics):
+    recorded = {}
+    monkeypatch.setattr(instrumentation, "_enabled", True)
+    monkeypatch.setattr(instrumentation, "record_iterations",
+                        lambda name, iterations, converged=None: recorded.update({name: (iterations, converged)}))
+    inverse_problem_batch(*points, elip)
+    *_, converged, iterations = kernels.inverse_problem(*points, elip, return_iterations=True)
+    ref_iterations, ref_converged = recorded["inverse_problem_batch"]
+    np.testing.assert_array_equal(converged, ref_converged)
+    # Rounding may move the convergence test by one iteration
+    assert np.max(np.abs(iterations - ref_iterations)) <= 1
+    assert np.all(iterations[~converged] == 2000)
+
+    rng = np.random.default_rng(1)
+    alpha1, s = rng.uniform(0, 360, N), rng.uniform(0, 2.0E7, N)
+    problema_direto_batch(points[0], points[1], alpha1, s, elip)
+    *_, converged, iterations = kernels.problema_direto(points[0], points[1], alpha1, s, elip, return_iterations=True)
+    ref_iterations, ref_converged = recorded["problema_direto_batch"]
+    np.testing.assert_array_equal(converged, ref_converged)
+    assert np.max(np.abs(iterations - ref_iterations)) <= 1
@@ -1,5 +1,39 @@
 import numpy as np
+import instrumentation
+from instrumentation import instrumented
 
+BACKENDS = ("numpy", "numba")
+_backend = "numpy"
+
+
+def set_backend(name):
+    """
+    Selects the implementation used by inverse_problem_batch and
+    problema_direto_batch: "numpy" (the default) or "numba", the compiled
+    kernels of vincenty_kernels, which require Numba to be installed
+
+    Parameters
+    -----------
+    name: str
+        Name of the backend
+    """
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError("backend must be one of {}".format(", ".join(BACKENDS)))
+    if name == "numba":
+        from vincenty_kernels import NUMBA_AVAILABLE
+        if not NUMBA_AVAILABLE:
+            raise ImportError("the numba backend requires the numba package")
+    _backend = name
+
+
+def get_backend():
+    """
+    Returns the name of the backend in use
+    """
+    return _backend
+
+@instrumented("inverse_problem")
 def inverse_problem(phi1, lamb1, phi2, lamb2, elip):
     """
     Given the coordinates of two points and an ellipsoid, this function
@@ -54,7 +88,10 @@ def inverse_problem(phi1, lamb1, phi2, lamb2, elip):
         if dif < 1.0E-12 or i >= 2000:
             break
 
-    u2 = cos2_alpha * ((elip.a**2-elip.b**2)/elip.b**2)
+    if instrumentation.is_enabled():
+        instrumentation.record_iterations("inverse_problem", i, dif < 1.0E-12)
+
+    u2 = cos2_alpha * elip.e2_sq
     A = 1 + (u2/16384)*(4096+u2*(-768+u2*(320-175*u2)))
     B = (u2/1024)*(256+u2*(-128+u2*(74-47*u2)))
     del_sigma = B*sin_sigma*(cos_dsigm+0.25*B*(cos_sigma*(-1+2*cos_dsigm**2)-(1/6)*B
@@ -74,6 +111,7 @@ def inverse_problem(phi1, lamb1, phi2, lamb2, elip):
 
     return s, alpha1, alpha2
 
+@instrumented("problema_direto")
 def problema_direto(phi1, lamb1, alpha1, s, elip):
     """
     Given the coordinate of a point, azimuth alpha1, ellipsoidal distance
@@ -108,7 +146,7 @@ def problema_direto(phi1, lamb1, alpha1, s, elip):
     sigma1 = np.arctan2(np.tan(U1), np.cos(alpha1))
     sin_alpha = np.cos(U1)*np.sin(alpha1)
     cos2_alpha = 1 - sin_alpha**2
-    u2 = cos2_alpha*((elip.a**2-elip.b**2)/elip.b**2)
+    u2 = cos2_alpha*elip.e2_sq
     A = 1 + (u2/16384)*(4096+u2*(-768+u2*(320-175*u2)))
     B = (u2/1024)*(256+u2*(-128+u2*(74-47*u2)))
     sigma = s/(elip.b * A)
@@ -123,9 +161,12 @@ def problema_direto(phi1, lamb1, alpha1, s, elip):
                                                                   (-3+4*(np.cos(dois_sigma_m))**2)))
 
         sigma = (s/(elip.b*A)) + del_sigma
-        if sigma-sig_aux < 1.0E-12 or i >= 2000:
+        if np.abs(sigma-sig_aux) < 1.0E-12 or i >= 2000:
             break
 
+    if instrumentation.is_enabled():
+        instrumentation.record_iterations("problema_direto", i, np.abs(sigma-sig_aux) < 1.0E-12)
+
     phi2 = np.rad2deg(np.arctan2(np.sin(U1)*np.cos(sigma)+np.cos(U1)*np.sin(sigma)*np.cos(alpha1),
                                  (1-elip.f)*np.sqrt(sin_alpha**2+(np.sin(U1)*np.sin(sigma)-np.cos(U1) *
                                                                   np.cos(sigma)*np.cos(alpha1))**2)))
@@ -143,3 +184,325 @@ def problema_direto(phi1, lamb1, alpha1, s, elip):
         alpha2 = alpha2 + 360
 
     return phi2, lamb2, alpha2
+
+
+@instrumented("inverse_problem_batch")
+def inverse_problem_batch(phi1, lamb1, phi2, lamb2, elip, tol=1.0E-12, max_iter=2000):
+    """
+    Vectorized version of inverse_problem. All pairs are iterated together and
+    each pair leaves the iteration as soon as its own lambda has converged.
+
+    Parameters
+    -----------
+    phi1: array_like
+        Latitudes of points 1 in degrees
+    lamb1: array_like
+        Longitudes of points 1 in degrees
+    phi2: array_like
+        Latitudes of points 2 in degrees
+    lamb2: array_like
+        Longitudes of points 2 in degrees
+    elip: object
+        Instance of the Ellipsoid class
+    tol: float
+        Convergence threshold for lambda, in radians
+    max_iter: int
+        Maximum number of iterations
+
+    Returns
+    --------
+    ndarray
+        Ellipsoidal distances in meters
+    ndarray
+        Azimuths from 1 to 2 in degrees
+    ndarray
+        Azimuths from 2 to 1 in degrees
+    ndarray
+        Boolean mask, False for the pairs that did not converge (usually
+        nearly antipodal points)
+    """
+    if _backend == "numba":
+        import vincenty_kernels
+        if not instrumentation.is_enabled():
+            return vincenty_kernels.inverse_problem(phi1, lamb1, phi2, lamb2, elip, tol, max_iter)
+        s, alpha1, alpha2, converged, iterations = vincenty_kernels.inverse_problem(
+            phi1, lamb1, phi2, lamb2, elip, tol, max_iter, return_iterations=True)
+        instrumentation.record_iterations("inverse_problem_batch", iterations, converged)
+        return s, alpha1, alpha2, converged
+    phi1, lamb1, phi2, lamb2 = np.broadcast_arrays(np.asarray(phi1, dtype=float), np.asarray(lamb1, dtype=float),
+                                                   np.asarray(phi2, dtype=float), np.asarray(lamb2, dtype=float))
+    shape = phi1.shape
+    phi1, lamb1 = np.deg2rad(phi1.ravel()), lamb1.ravel()
+    phi2, lamb2 = np.deg2rad(phi2.ravel()), lamb2.ravel()
+
+    L = np.deg2rad(lamb2-lamb1)
+    U1 = np.arctan((1 - elip.f)*np.tan(phi1))
+    U2 = np.arctan((1 - elip.f)*np.tan(phi2))
+    sin_U1, cos_U1 = np.sin(U1), np.cos(U1)
+    sin_U2, cos_U2 = np.sin(U2), np.cos(U2)
+
+    c0, c1, c2 = elip.vincenty_coeffs
+    lamb = L.copy()
+    sin_sigma = np.zeros_like(L)
+    cos_sigma = np.zeros_like(L)
+    sigma = np.zeros_like(L)
+    cos2_alpha = np.zeros_like(L)
+    cos_dsigm = np.zeros_like(L)
+    converged = np.zeros(L.shape, dtype=bool)
+    iterations = np.full(L.shape, max_iter)
+    active = np.arange(L.size)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for i in range(max_iter):
+            if active.size == 0:
+                break
+            lamb_a = lamb[active]
+            su1, cu1 = sin_U1[active], cos_U1[active]
+            su2, cu2 = sin_U2[active], cos_U2[active]
+            sin_lamb, cos_lamb = np.sin(lamb_a), np.cos(lamb_a)
+
+            sin_sig = np.sqrt((cu2*sin_lamb)**2 + (cu1*su2 - su1*cu2*cos_lamb)**2)
+            cos_sig = su1*su2 + cu1*cu2*cos_lamb
+            sig = np.arctan2(sin_sig, cos_sig)
+            # Coincident points: sin_sigma is zero and the azimuth is undefined
+            sin_alpha = np.where(sin_sig == 0, 0.0, cu1*cu2*sin_lamb/sin_sig)
+            c2a = 1 - sin_alpha**2
+            # Equatorial lines: cos2_alpha is zero and so is cos(2*sigma_m)
+            cdsm = np.where(c2a == 0, 0.0, cos_sig - 2*su1*su2/c2a)
+            C = c0*c2a*(c1 - c2*c2a)
+            lamb_new = L[active] + (1 - C)*elip.f*sin_alpha*(sig + C*sin_sig*(cdsm + C*cos_sig *
+                                                                               (-1+2*cdsm**2)))
+
+            lamb[active] = lamb_new
+            sin_sigma[active] = sin_sig
+            cos_sigma[active] = cos_sig
+            sigma[active] = sig
+            cos2_alpha[active] = c2a
+            cos_dsigm[active] = cdsm
+
+            done = np.abs(lamb_new-lamb_a) < tol
+            converged[active[done]] = True
+            iterations[active[done]] = i + 1
+            active = active[~done]
+
+    u2 = cos2_alpha * elip.e2_sq
+    A = 1 + (u2/16384)*(4096+u2*(-768+u2*(320-175*u2)))
+    B = (u2/1024)*(256+u2*(-128+u2*(74-47*u2)))
+    del_sigma = B*sin_sigma*(cos_dsigm+0.25*B*(cos_sigma*(-1+2*cos_dsigm**2)-(1/6)*B
+                                               * cos_dsigm*(-3+4*sin_sigma**2)*(-3+4*cos_dsigm**2)))
+    s = elip.b*A*(sigma-del_sigma)
+    sin_lamb, cos_lamb = np.sin(lamb), np.cos(lamb)
+    alpha1 = np.rad2deg(np.arctan2(cos_U2*sin_lamb, cos_U1*sin_U2 - sin_U1*cos_U2*cos_lamb))
+    alpha2 = np.rad2deg(np.arctan2(cos_U1*sin_lamb, -sin_U1*cos_U2 + cos_U1*sin_U2*cos_lamb))
+
+    # Normalizing azimuths to 0..360:
+    alpha1 = np.mod(alpha1, 360)
+    alpha2 = np.mod(alpha2, 360)
+
+    if instrumentation.is_enabled():
+        instrumentation.record_iterations("inverse_problem_batch", iterations, converged)
+
+    return s.reshape(shape), alpha1.reshape(shape), alpha2.reshape(shape), converged.reshape(shape)
+
+
+def _direct_constants(phi1, alpha1, elip):
+    """
+    Quantities of the direct problem that depend only on the starting point
+    and azimuth (both in radians), and not on the distance
+    """
+    U1 = np.arctan((1-elip.f)*np.tan(phi1))
+    cos_alpha1 = np.cos(alpha1)
+    sin_alpha = np.cos(U1)*np.sin(alpha1)
+    cos2_alpha = 1 - sin_alpha**2
+    u2 = cos2_alpha*elip.e2_sq
+    c0, c1, c2 = elip.vincenty_coeffs
+    return {'sin_U1': np.sin(U1), 'cos_U1': np.cos(U1), 'sin_alpha1': np.sin(alpha1), 'cos_alpha1': cos_alpha1,
+            'sigma1': np.arctan2(np.tan(U1), cos_alpha1), 'sin_alpha': sin_alpha, 'cos2_alpha': cos2_alpha,
+            'A': 1 + (u2/16384)*(4096+u2*(-768+u2*(320-175*u2))),
+            'B': (u2/1024)*(256+u2*(-128+u2*(74-47*u2))),
+            'C': c0*cos2_alpha*(c1 - c2*cos2_alpha)}
+
+
+def _direct_solve(k, lamb1, s, elip, tol, max_iter):
+    """
+    Solves the direct problem for the distances s (meters) from the
+    constants k of _direct_constants and the longitudes lamb1 (radians).
+    Returns the end points and azimuths in degrees, the iteration count of
+    each element and the indices of the elements that did not converge.
+    """
+    sigma1, B = k['sigma1'], k['B']
+    sigma0 = s/(elip.b * k['A'])
+    sigma = sigma0.copy()
+    active = np.arange(sigma.size)
+    iterations = np.full(sigma.shape, max_iter)
+
+    for i in range(max_iter):
+        if active.size == 0:
+            break
+        sig_aux = sigma[active]
+        B_a = B[active]
+        cos_2sm = np.cos(2*sigma1[active] + sig_aux)
+        sin_sig = np.sin(sig_aux)
+        del_sigma = B_a*sin_sig*(cos_2sm+0.25*B_a*(np.cos(sig_aux)*(-1+2*cos_2sm**2)-(1/6)*B_a
+                                                    * cos_2sm*(-3+4*sin_sig**2)*(-3+4*cos_2sm**2)))
+        sig_new = sigma0[active] + del_sigma
+        sigma[active] = sig_new
+        done = np.abs(sig_new-sig_aux) < tol
+        iterations[active[done]] = i + 1
+        active = active[~done]
+
+    sin_U1, cos_U1, sin_alpha, C = k['sin_U1'], k['cos_U1'], k['sin_alpha'], k['C']
+    sin_alpha1, cos_alpha1 = k['sin_alpha1'], k['cos_alpha1']
+    sin_sigma, cos_sigma = np.sin(sigma), np.cos(sigma)
+    cos_2sm = np.cos(2*sigma1 + sigma)
+    phi2 = np.rad2deg(np.arctan2(sin_U1*cos_sigma+cos_U1*sin_sigma*cos_alpha1,
+                                 (1-elip.f)*np.sqrt(sin_alpha**2+(sin_U1*sin_sigma-cos_U1*cos_sigma*cos_alpha1)**2)))
+    lamb = np.arctan2(sin_sigma*sin_alpha1, cos_U1*cos_sigma-sin_U1*sin_sigma*cos_alpha1)
+    L = lamb - (1-C)*elip.f*sin_alpha*(sigma+C*sin_sigma*(cos_2sm+C*cos_sigma*(-1+2*cos_2sm**2)))
+    lamb2 = np.rad2deg(lamb1 + L)
+    alpha2 = np.rad2deg(np.arctan2(sin_alpha, -sin_U1*sin_sigma + cos_U1*cos_sigma*cos_alpha1))
+
+    # Normalizing the azimuth to 0..360:
+    alpha2 = np.mod(alpha2, 360)
+
+    return phi2, lamb2, alpha2, iterations, active
+
+
+@instrumented("problema_direto_batch")
+def problema_direto_batch(phi1, lamb1, alpha1, s, elip, tol=1.0E-12, max_iter=2000):
+    """
+    Vectorized version of problema_direto. The inputs are broadcast against
+    each other, so one origin with azimuths of shape (N, 1) and distances of
+    shape (M,) returns (N, M) grids. Each element leaves the iteration as soon
+    as its own sigma has converged.
+
+    Parameters
+    ----------
+    phi1: array_like
+        Latitudes of points 1 in degrees
+    lamb1: array_like
+        Longitudes of points 1 in degrees
+    alpha1: array_like
+        Azimuths from 1 to 2 in degrees
+    s: array_like
+        Ellipsoidal distances in meters
+    elip: object
+        Instance of the Ellipsoid class
+    tol: float
+        Convergence threshold for sigma, in radians
+    max_iter: int
+        Maximum number of iterations
+
+    Returns
+    --------
+    ndarray
+        Latitudes of points 2 in degrees
+    ndarray
+        Longitudes of points 2 in degrees
+    ndarray
+        Azimuths from 2 to 1 in degrees
+    """
+    if _backend == "numba":
+        import vincenty_kernels
+        if not instrumentation.is_enabled():
+            return vincenty_kernels.problema_direto(phi1, lamb1, alpha1, s, elip, tol, max_iter)
+        phi2, lamb2, alpha2, converged, iterations = vincenty_kernels.problema_direto(
+            phi1, lamb1, alpha1, s, elip, tol, max_iter, return_iterations=True)
+        instrumentation.record_iterations("problema_direto_batch", iterations, converged)
+        return phi2, lamb2, alpha2
+    phi1, lamb1, alpha1, s = np.broadcast_arrays(np.asarray(phi1, dtype=float), np.asarray(lamb1, dtype=float),
+                                                 np.asarray(alpha1, dtype=float), np.asarray(s, dtype=float))
+    shape = phi1.shape
+    phi1, lamb1 = np.deg2rad(phi1.ravel()), np.deg2rad(lamb1.ravel())
+    alpha1, s = np.deg2rad(alpha1.ravel()), s.ravel()
+
+    consts = _direct_constants(phi1, alpha1, elip)
+    phi2, lamb2, alpha2, iterations, active = _direct_solve(consts, lamb1, s, elip, tol, max_iter)
+
+    if instrumentation.is_enabled():
+        converged = np.ones(s.shape, dtype=bool)
+        converged[active] = False
+        instrumentation.record_iterations("problema_direto_batch", iterations, converged)
+
+    return phi2.reshape(shape), lamb2.reshape(shape), alpha2.reshape(shape)
+
+
+@instrumented("densify")
+def densify(phi1, lamb1, phi2, lamb2, elip, n_points=None, spacing=None, tol=1.0E-12, max_iter=2000):
+    """
+    Generates points along the geodesics between pairs of points. The
+    inverse problem is solved once per segment, and then all the intermediate
+    points of all the segments come from a single direct evaluation that
+    reuses the constants of each segment (U1, sigma1, A, B, C).
+
+    Exactly one of n_points and spacing must be given.
+
+    Parameters
+    ----------
+    phi1: array_like
+        Latitudes of the starting points in degrees
+    lamb1: array_like
+        Longitudes of the starting points in degrees
+    phi2: array_like
+        Latitudes of the end points in degrees
+    lamb2: array_like
+        Longitudes of the end points in degrees
+    elip: object
+        Instance of the Ellipsoid class
+    n_points: int
+        Number of evenly spaced points per segment, both ends included
+    spacing: float
+        Distance in meters between consecutive points. The last interval of
+        each segment is shorter, ending at the end point
+    tol: float
+        Convergence threshold of both problems, in radians
+    max_iter: int
+        Maximum number of iterations of both problems
+
+    Returns
+    --------
+    ndarray
+        Latitudes of the points in degrees
+    ndarray
+        Longitudes of the points in degrees, from -180 to 180
+    ndarray
+        Offsets of shape (n_segments+1,): the points of segment i are in the
+        slice offsets[i]:offsets[i+1], from its starting to its end point
+    ndarray
+        Boolean mask of shape (n_segments,), False for the segments whose
+        inverse problem did not converge (usually nearly antipodal points):
+        their intermediate points follow an unreliable azimuth
+    """
+    if (n_points is None) == (spacing is None):
+        raise ValueError("exactly one of n_points and spacing must be given")
+    phi1, lamb1, phi2, lamb2 = (np.ravel(x).astype(float) for x in np.broadcast_arrays(phi1, lamb1, phi2, lamb2))
+    s, alpha1, _, converged = inverse_problem_batch(phi1, lamb1, phi2, lamb2, elip, tol, max_iter)
+
+    if n_points is not None:
+        if n_points < 2:
+            raise ValueError("n_points must be at least 2")
+        counts = np.full(s.size, n_points)
+    else:
+        if not np.isfinite(spacing) or spacing <= 0:
+            raise ValueError("spacing must be positive and finite")
+        if not np.all(np.isfinite(s)):
+            raise ValueError("the distance of some segments is not finite; check the end points")
+        counts = np.ceil(s/spacing).astype(int) + 1
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    seg = np.repeat(np.arange(s.size), counts)
+    k = np.arange(offsets[-1]) - offsets[seg]
+    if n_points is not None:
+        dist = s[seg]*k/(n_points - 1)
+    else:
+        dist = np.minimum(k*spacing, s[seg])
+
+    consts = _direct_constants(np.deg2rad(phi1), np.deg2rad(alpha1), elip)
+    consts = {name: value[seg] for name, value in consts.items()}
+    phi, lamb, _, _, _ = _direct_solve(consts, np.deg2rad(lamb1)[seg], dist, elip, tol, max_iter)
+    # The ends of each segment are the given points
+    phi[offsets[:-1]], lamb[offsets[:-1]] = phi1, lamb1
+    phi[offsets[1:] - 1], lamb[offsets[1:] - 1] = phi2, lamb2
+    # Normalizing all the longitudes, ends included, to -180..180, across the
+    # antimeridian:
+    lamb = (lamb + 180) % 360 - 180
+    return phi, lamb, offsets, converged
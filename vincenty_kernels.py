@@ -0,0 +1,203 @@
+"""
+Compiled kernels of the Vincenty formulae, used by the "numba" backend of
+vincenty_dist_formulae. Each pair is solved by a scalar loop, so no temporary
+arrays are allocated and a pair stops iterating as soon as it converges. The
+pairs are spread across cores with prange.
+
+Numba is optional: without it NUMBA_AVAILABLE is False and the kernels are
+plain (slow) Python functions, which are only useful for checking them.
+"""
+import math
+
+import numpy as np
+
+# Largest differences accepted between the kernels and the NumPy solvers. The
+# kernels use the scalar math functions and NumPy the vectorized ones, and
+# they group some operations differently, so the results agree only to a few
+# units in the last place. One unit of a distance of 20000 km is 3.7E-9 m and
+# the largest difference measured was of that size, hence 1E-8 m. Azimuths and
+# coordinates differed by about 1E-13 degrees; 1E-11 degrees (about 1 micrometer
+# on the ground) leaves room for other platforms' libm.
+DISTANCE_TOL = 1.0E-8
+ANGLE_TOL = 1.0E-11
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+@njit(cache=True)
+def _inverse_pair(phi1, lamb1, phi2, lamb2, a, b, f, e2_sq, c0, c1, c2, tol, max_iter):
+    L = math.radians(lamb2 - lamb1)
+    U1 = math.atan((1 - f)*math.tan(math.radians(phi1)))
+    U2 = math.atan((1 - f)*math.tan(math.radians(phi2)))
+    sin_U1, cos_U1 = math.sin(U1), math.cos(U1)
+    sin_U2, cos_U2 = math.sin(U2), math.cos(U2)
+
+    lamb = L
+    sin_sigma = cos_sigma = sigma = cos2_alpha = cos_dsigm = 0.0
+    converged = False
+    iterations = max_iter
+    for i in range(max_iter):
+        sin_lamb, cos_lamb = math.sin(lamb), math.cos(lamb)
+        sin_sigma = math.sqrt((cos_U2*sin_lamb)**2 + (cos_U1*sin_U2 - sin_U1*cos_U2*cos_lamb)**2)
+        cos_sigma = sin_U1*sin_U2 + cos_U1*cos_U2*cos_lamb
+        sigma = math.atan2(sin_sigma, cos_sigma)
+        sin_alpha = 0.0 if sin_sigma == 0 else cos_U1*cos_U2*sin_lamb/sin_sigma
+        cos2_alpha = 1 - sin_alpha**2
+        cos_dsigm = 0.0 if cos2_alpha == 0 else cos_sigma - 2*sin_U1*sin_U2/cos2_alpha
+        C = c0*cos2_alpha*(c1 - c2*cos2_alpha)
+        lamb_prev = lamb
+        lamb = L + (1 - C)*f*sin_alpha*(sigma + C*sin_sigma*(cos_dsigm + C*cos_sigma*(-1 + 2*cos_dsigm**2)))
+        if abs(lamb - lamb_prev) < tol:
+            converged = True
+            iterations = i + 1
+            break
+
+    u2 = cos2_alpha*e2_sq
+    A = 1 + (u2/16384)*(4096 + u2*(-768 + u2*(320 - 175*u2)))
+    B = (u2/1024)*(256 + u2*(-128 + u2*(74 - 47*u2)))
+    del_sigma = B*sin_sigma*(cos_dsigm + 0.25*B*(cos_sigma*(-1 + 2*cos_dsigm**2) - (1/6)*B
+                                                 * cos_dsigm*(-3 + 4*sin_sigma**2)*(-3 + 4*cos_dsigm**2)))
+    s = b*A*(sigma - del_sigma)
+    sin_lamb, cos_lamb = math.sin(lamb), math.cos(lamb)
+    alpha1 = math.degrees(math.atan2(cos_U2*sin_lamb, cos_U1*sin_U2 - sin_U1*cos_U2*cos_lamb)) % 360
+    alpha2 = math.degrees(math.atan2(cos_U1*sin_lamb, -sin_U1*cos_U2 + cos_U1*sin_U2*cos_lamb)) % 360
+    return s, alpha1, alpha2, converged, iterations
+
+
+@njit(cache=True)
+def _direct_pair(phi1, lamb1, alpha1, s, a, b, f, e2_sq, c0, c1, c2, tol, max_iter):
+    alpha1 = math.radians(alpha1)
+    U1 = math.atan((1 - f)*math.tan(math.radians(phi1)))
+    sin_U1, cos_U1 = math.sin(U1), math.cos(U1)
+    sin_alpha1, cos_alpha1 = math.sin(alpha1), math.cos(alpha1)
+    sigma1 = math.atan2(math.tan(U1), cos_alpha1)
+    sin_alpha = cos_U1*sin_alpha1
+    cos2_alpha = 1 - sin_alpha**2
+    u2 = cos2_alpha*e2_sq
+    A = 1 + (u2/16384)*(4096 + u2*(-768 + u2*(320 - 175*u2)))
+    B = (u2/1024)*(256 + u2*(-128 + u2*(74 - 47*u2)))
+    sigma0 = s/(b*A)
+    sigma = sigma0
+    converged = False
+    iterations = max_iter
+    for i in range(max_iter):
+        sig_aux = sigma
+        cos_2sm = math.cos(2*sigma1 + sigma)
+        sin_sig = math.sin(sigma)
+        del_sigma = B*sin_sig*(cos_2sm + 0.25*B*(math.cos(sigma)*(-1 + 2*cos_2sm**2) - (1/6)*B
+                                                  * cos_2sm*(-3 + 4*sin_sig**2)*(-3 + 4*cos_2sm**2)))
+        sigma = sigma0 + del_sigma
+        if abs(sigma - sig_aux) < tol:
+            converged = True
+            iterations = i + 1
+            break
+
+    sin_sigma, cos_sigma = math.sin(sigma), math.cos(sigma)
+    cos_2sm = math.cos(2*sigma1 + sigma)
+    phi2 = math.degrees(math.atan2(sin_U1*cos_sigma + cos_U1*sin_sigma*cos_alpha1,
+                                   (1 - f)*math.sqrt(sin_alpha**2 + (sin_U1*sin_sigma
+                                                                     - cos_U1*cos_sigma*cos_alpha1)**2)))
+    lamb = math.atan2(sin_sigma*sin_alpha1, cos_U1*cos_sigma - sin_U1*sin_sigma*cos_alpha1)
+    C = c0*cos2_alpha*(c1 - c2*cos2_alpha)
+    L = lamb - (1 - C)*f*sin_alpha*(sigma + C*sin_sigma*(cos_2sm + C*cos_sigma*(-1 + 2*cos_2sm**2)))
+    lamb2 = lamb1 + math.degrees(L)
+    alpha2 = math.degrees(math.atan2(sin_alpha, -sin_U1*sin_sigma + cos_U1*cos_sigma*cos_alpha1)) % 360
+    return phi2, lamb2, alpha2, converged, iterations
+
+
+@njit(parallel=True, cache=True)
+def _inverse_loop(phi1, lamb1, phi2, lamb2, a, b, f, e2_sq, c0, c1, c2, tol, max_iter,
+                  s, alpha1, alpha2, converged, iterations):
+    for i in prange(phi1.size):
+        s[i], alpha1[i], alpha2[i], converged[i], iterations[i] = _inverse_pair(
+            phi1[i], lamb1[i], phi2[i], lamb2[i], a, b, f, e2_sq, c0, c1, c2, tol, max_iter)
+
+
+@njit(parallel=True, cache=True)
+def _direct_loop(phi1, lamb1, alpha1, s, a, b, f, e2_sq, c0, c1, c2, tol, max_iter,
+                 phi2, lamb2, alpha2, converged, iterations):
+    for i in prange(phi1.size):
+        phi2[i], lamb2[i], alpha2[i], converged[i], iterations[i] = _direct_pair(
+            phi1[i], lamb1[i], alpha1[i], s[i], a, b, f, e2_sq, c0, c1, c2, tol, max_iter)
+
+
+def _flatten(*arrays):
+    arrays = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in arrays))
+    return arrays[0].shape, [np.ascontiguousarray(x).ravel() for x in arrays]
+
+
+def inverse_problem(phi1, lamb1, phi2, lamb2, elip, tol=1.0E-12, max_iter=2000, return_iterations=False):
+    """
+    Kernel version of vincenty_dist_formulae.inverse_problem_batch, with the
+    same parameters and results. With return_iterations, the iteration count
+    of each pair (max_iter if it did not converge) is returned last
+    """
+    shape, (phi1, lamb1, phi2, lamb2) = _flatten(phi1, lamb1, phi2, lamb2)
+    s, alpha1, alpha2 = np.empty_like(phi1), np.empty_like(phi1), np.empty_like(phi1)
+    converged = np.empty(phi1.shape, dtype=bool)
+    iterations = np.empty(phi1.shape, dtype=np.int64)
+    _inverse_loop(phi1, lamb1, phi2, lamb2, elip.a, elip.b, elip.f, elip.e2_sq, *elip.vincenty_coeffs,
+                  tol, max_iter, s, alpha1, alpha2, converged, iterations)
+    result = s.reshape(shape), alpha1.reshape(shape), alpha2.reshape(shape), converged.reshape(shape)
+    return result + (iterations.reshape(shape),) if return_iterations else result
+
+
+def problema_direto(phi1, lamb1, alpha1, s, elip, tol=1.0E-12, max_iter=2000, return_iterations=False):
+    """
+    Kernel version of vincenty_dist_formulae.problema_direto_batch, with the
+    same parameters and results. With return_iterations, the mask of the
+    points that converged and their iteration counts are returned last
+    """
+    shape, (phi1, lamb1, alpha1, s) = _flatten(phi1, lamb1, alpha1, s)
+    phi2, lamb2, alpha2 = np.empty_like(phi1), np.empty_like(phi1), np.empty_like(phi1)
+    converged = np.empty(phi1.shape, dtype=bool)
+    iterations = np.empty(phi1.shape, dtype=np.int64)
+    _direct_loop(phi1, lamb1, alpha1, s, elip.a, elip.b, elip.f, elip.e2_sq, *elip.vincenty_coeffs,
+                 tol, max_iter, phi2, lamb2, alpha2, converged, iterations)
+    result = phi2.reshape(shape), lamb2.reshape(shape), alpha2.reshape(shape)
+    if return_iterations:
+        return result + (converged.reshape(shape), iterations.reshape(shape))
+    return result
+
+
+def compare_backends(elip, n=10000, seed=0):
+    """
+    Solves n random pairs with the kernels and with the NumPy implementation
+    and returns the largest differences: distance (m), azimuths and end
+    point coordinates (degrees). The kernels use the scalar math functions
+    instead of NumPy's, so the results may differ by a few units in the last
+    place: up to DISTANCE_TOL (1E-8 m) and ANGLE_TOL (1E-11 degrees), the
+    tolerances the tests enforce.
+    """
+    from vincenty_dist_formulae import inverse_problem_batch, problema_direto_batch
+
+    rng = np.random.default_rng(seed)
+    phi1, phi2 = rng.uniform(-89, 89, n), rng.uniform(-89, 89, n)
+    lamb1, lamb2 = rng.uniform(-180, 180, n), rng.uniform(-180, 180, n)
+    ref = inverse_problem_batch(phi1, lamb1, phi2, lamb2, elip)
+    res = inverse_problem(phi1, lamb1, phi2, lamb2, elip)
+    ok = ref[3] & res[3]
+    az = rng.uniform(0, 360, n)
+    dist = rng.uniform(0, 2.0E7, n)
+    ref_d = problema_direto_batch(phi1, lamb1, az, dist, elip)
+    res_d = problema_direto(phi1, lamb1, az, dist, elip)
+
+    def angle(x, y):
+        return np.max(np.abs((x - y + 180) % 360 - 180))
+
+    return {'s': np.max(np.abs(ref[0] - res[0])[ok]),
+            'alpha1': angle(ref[1][ok], res[1][ok]),
+            'alpha2': angle(ref[2][ok], res[2][ok]),
+            'phi2': np.max(np.abs(ref_d[0] - res_d[0])),
+            'lamb2': angle(ref_d[1], res_d[1]),
+            'alpha2_direct': angle(ref_d[2], res_d[2])}